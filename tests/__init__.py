@@ -0,0 +1,2 @@
+import logging
+logging.getLogger('tvb').addHandler(logging.NullHandler())
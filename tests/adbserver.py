@@ -0,0 +1,141 @@
+import os
+import socket
+import struct
+import subprocess
+from threading import Thread
+
+SERIAL = 'emulator-5554'
+VERSION = 41
+
+class Hangup(Exception):
+    pass
+
+class AdbServer(Thread):
+    '''Stand-in adb server speaking the host protocol on a free local port.
+
+    The shell services run sh on the host in root, sync paths are
+    taken relative to root. A service named in hangup gets its
+    connection closed instead of an answer, RECV after the first
+    data chunk.
+    '''
+    def __init__(self, root):
+        Thread.__init__(self, name='adb server')
+        self.setDaemon(True)
+        self.root = root
+        self.hangup = set()
+        self.server = socket.socket()
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(16)
+        self.port = self.server.getsockname()[1]
+
+    def run(self):
+        while True:
+            try:
+                sock = self.server.accept()[0]
+            except socket.error:
+                return
+            thread = Thread(target=self.handle, args=(sock,))
+            thread.setDaemon(True)
+            thread.start()
+
+    def close(self):
+        self.server.close()
+
+    def recv(self, sock, size):
+        data = ''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise Hangup()
+            data += chunk
+        return data
+
+    def reply(self, sock, text):
+        sock.sendall('OKAY%04x%s' % (len(text), text))
+
+    def fail(self, sock, text):
+        sock.sendall('FAIL%04x%s' % (len(text), text))
+
+    def handle(self, sock):
+        try:
+            while True:
+                request = self.recv(sock, int(self.recv(sock, 4), 16))
+                if [service for service in self.hangup if request.startswith(service)]:
+                    return
+                if request == 'host:version':
+                    return self.reply(sock, '%04x' % VERSION)
+                if request == 'host:devices':
+                    return self.reply(sock, '%s\tdevice\n' % SERIAL)
+                if request.startswith('host:transport:'):
+                    if request[15:] != SERIAL:
+                        return self.fail(sock, "device '%s' not found" % request[15:])
+                    sock.sendall('OKAY')
+                    continue
+                if request.startswith('shell:'):
+                    sock.sendall('OKAY')
+                    return self.shell(sock, request[6:])
+                if request == 'sync:':
+                    sock.sendall('OKAY')
+                    return self.sync(sock)
+                return self.fail(sock, 'unknown service %s' % request)
+        except (Hangup, socket.error):
+            pass
+        finally:
+            sock.close()
+
+    def shell(self, sock, cmd):
+        if cmd:
+            process = subprocess.Popen(['sh', '-c', cmd], cwd=self.root, stdin=open(os.devnull), stdout=subprocess.PIPE, close_fds=True)
+            for data in iter(lambda: process.stdout.read(4096), ''):
+                sock.sendall(data)
+            process.wait()
+            return
+        process = subprocess.Popen(['sh'], cwd=self.root, stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True)
+        def pump():
+            for data in iter(lambda: os.read(process.stdout.fileno(), 4096), ''):
+                sock.sendall(data)
+            sock.shutdown(socket.SHUT_RDWR)
+        thread = Thread(target=pump)
+        thread.setDaemon(True)
+        thread.start()
+        try:
+            for data in iter(lambda: sock.recv(4096), ''):
+                process.stdin.write(data)
+                process.stdin.flush()
+        except (IOError, socket.error):
+            pass
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        thread.join()
+
+    def sync(self, sock):
+        while True:
+            kind = self.recv(sock, 4)
+            size = struct.unpack('<I', self.recv(sock, 4))[0]
+            if kind == 'QUIT':
+                return
+            path = os.path.join(self.root, self.recv(sock, size).lstrip('/'))
+            if kind == 'RECV':
+                if not os.path.isfile(path):
+                    message = 'No such file or directory'
+                    sock.sendall('FAIL' + struct.pack('<I', len(message)) + message)
+                    continue
+                with open(path, 'rb') as f:
+                    for data in iter(lambda: f.read(64 * 1024), ''):
+                        sock.sendall('DATA' + struct.pack('<I', len(data)) + data)
+                        if 'RECV' in self.hangup:
+                            return
+                sock.sendall('DONE' + struct.pack('<I', 0))
+            elif kind == 'SEND':
+                with open(path.rsplit(',', 1)[0], 'wb') as f:
+                    while True:
+                        kind = self.recv(sock, 4)
+                        size = struct.unpack('<I', self.recv(sock, 4))[0]
+                        if kind == 'DONE':
+                            break
+                        f.write(self.recv(sock, size))
+                sock.sendall('OKAY' + struct.pack('<I', 0))
+            else:
+                return
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tvb.adbclient import AdbClient, AdbError
+from tests.adbserver import AdbServer, SERIAL, VERSION
+
+class AdbClientTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.local = tempfile.mkdtemp()
+        self.server = AdbServer(self.root)
+        self.server.start()
+        self.client = AdbClient(port=self.server.port)
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.local)
+
+    def test_version(self):
+        self.assertEqual(self.client.version(), VERSION)
+
+    def test_devices(self):
+        self.assertEqual(self.client.devices(), [(SERIAL, 'device')])
+
+    def test_shell(self):
+        process = self.client.shell(SERIAL, 'echo hello; echo world')
+        self.assertEqual(process.communicate()[0], 'hello\nworld\n')
+        self.assertEqual(process.wait(), 0)
+
+    def test_interactive_shell(self):
+        process = self.client.shell(SERIAL)
+        process.stdin.write('echo first\n')
+        process.stdin.flush()
+        self.assertEqual(process.stdout.readline(), 'first\n')
+        process.stdin.write('echo second\n')
+        process.stdin.flush()
+        self.assertEqual(process.stdout.readline(), 'second\n')
+        self.assertEqual(process.poll(), None)
+        process.stdin.write('exit\n')
+        process.stdin.flush()
+        self.assertEqual(process.stdout.readline(), '')
+        self.assertEqual(process.wait(), 0)
+
+    def test_push_and_pull(self):
+        data = os.urandom(200 * 1024)
+        local = os.path.join(self.local, 'data')
+        with open(local, 'wb') as f:
+            f.write(data)
+        self.assertTrue(self.client.push(SERIAL, local, '/sdcard.bin'))
+        with open(os.path.join(self.root, 'sdcard.bin'), 'rb') as f:
+            self.assertEqual(f.read(), data)
+        pulled = os.path.join(self.local, 'pulled')
+        self.assertTrue(self.client.pull(SERIAL, '/sdcard.bin', pulled))
+        with open(pulled, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_fail(self):
+        self.assertRaises(AdbError, self.client.transport, 'unknown')
+        process = self.client.shell('unknown', 'echo hello')
+        self.assertEqual(process.wait(), 255)
+        self.assertEqual(process.communicate(), ('', None))
+        pulled = os.path.join(self.local, 'pulled')
+        self.assertFalse(self.client.pull(SERIAL, '/missing', pulled))
+        self.assertEqual(os.listdir(self.local), [])
+
+    def test_early_close(self):
+        self.server.hangup.add('host:version')
+        self.assertRaises(AdbError, self.client.version)
+        self.server.hangup.add('shell:')
+        self.assertEqual(self.client.shell(SERIAL, 'echo hello').wait(), 255)
+
+    def test_early_close_during_pull(self):
+        with open(os.path.join(self.root, 'large.bin'), 'wb') as f:
+            f.write(os.urandom(300 * 1024))
+        self.server.hangup.add('RECV')
+        pulled = os.path.join(self.local, 'pulled')
+        self.assertFalse(self.client.pull(SERIAL, '/large.bin', pulled))
+        self.assertEqual(os.listdir(self.local), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from tvb.agent import AGENT_PROBE, RECORD
+
+class AgentRecordTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def probe(self, commands):
+        '''run one round of the probes of the agent, return the ring'''
+        script = ['DIR=%s; gen=1; now=0\n' % self.dir]
+        for i, (name, command) in enumerate(commands):
+            script.append('next_%d=0\n' % i)
+            script.append(AGENT_PROBE % {'index': i, 'name': name, 'command': command, 'period': 1})
+        subprocess.call(['sh', '-c', ''.join(script)])
+        with open(os.path.join(self.dir, 'ring.1'), 'rb') as f:
+            return f.read()
+
+    def test_records(self):
+        ring = self.probe([('top', 'printf "a\\nb"'), ('temp', 'echo 42'), ('none', 'true'), ('last', 'printf c')])
+        records = [(m.group('name'), m.group('output').strip()) for m in RECORD.finditer(ring)]
+        self.assertEqual(records, [('top', 'a\nb'), ('temp', '42'), ('none', ''), ('last', 'c')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import cPickle as pickle
+import os
+import shutil
+import tempfile
+import unittest
+
+from tvb.cache import ParseCache
+from tvb.info import CpuInfo
+
+SAMPLE = '''>>10/18 19:%02d:%02d>>
+Load: %d.0 / 1.0 / 1.0
+CPU usage from 5000ms to 1ms ago:
+  %d%% 1234/com.example.app: 8%% user + 4%% kernel
+  3%% 567/system_server: 2%% user + 1%% kernel
+20%% TOTAL: 12%% user + 8%% kernel + 0%% iowait
+'''
+
+def get_samples(first, count):
+    return ''.join(SAMPLE % (i / 60, i % 60, i % 7, i % 50) for i in range(first, first + count))
+
+def get_sheets(info):
+    return [sheet[:4] + (list(sheet[4]),) for sheet in info.get_sheet_list()]
+
+class ParseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cpuinfo.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, text, mode='ab'):
+        with open(self.path, mode) as f:
+            f.write(text)
+
+    def parse(self, process_names, cache=True):
+        return get_sheets(CpuInfo(self.dir, 'cpuinfo.txt', process_names, 4, cache=cache))
+
+    def get_offset(self):
+        with open(ParseCache(self.path).cache_path, 'rb') as f:
+            return pickle.load(f)['offset']
+
+    def test_appended_samples(self):
+        self.write(get_samples(0, 50))
+        self.parse(['com.example.app'])
+        offset = self.get_offset()
+        # the last sample may still be written, it is parsed next time
+        self.assertEqual(offset, len(get_samples(0, 49)))
+        self.write(get_samples(50, 30))
+        self.assertEqual(self.parse(['com.example.app']), self.parse(['com.example.app'], cache=False))
+        self.assertTrue(self.get_offset() > offset)
+        self.assertEqual(len(self.parse(['com.example.app'])[0][4]), 79)
+
+    def test_sample_cut_in_the_middle(self):
+        samples = get_samples(0, 20)
+        self.write(samples[:len(samples) - 40])
+        self.parse(['com.example.app'])
+        self.write(samples[len(samples) - 40:])
+        self.write(get_samples(20, 1))
+        self.assertEqual(self.parse(['com.example.app']), self.parse(['com.example.app'], cache=False))
+
+    def test_new_process(self):
+        self.write(get_samples(0, 30))
+        self.parse(['com.example.app'])
+        self.write(get_samples(30, 10))
+        self.assertEqual(self.parse(['com.example.app', 'system_server']), self.parse(['com.example.app', 'system_server'], cache=False))
+
+    def test_replaced_log(self):
+        self.write(get_samples(0, 30))
+        self.parse(['com.example.app'])
+        os.remove(self.path)
+        self.write(get_samples(100, 5))
+        self.assertEqual(self.parse(['com.example.app']), self.parse(['com.example.app'], cache=False))
+        self.assertEqual(len(self.parse(['com.example.app'])[0][4]), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,17 @@
+import unittest
+from argparse import ArgumentTypeError
+
+from tvb.cli import schedule_type
+
+class ScheduleTypeTest(unittest.TestCase):
+    def test_cadence(self):
+        self.assertEqual(schedule_type('top=5'), ('top', [5.0]))
+        self.assertEqual(schedule_type('meminfo=60,,30'), ('meminfo', [60.0, None, 30.0]))
+        self.assertEqual(schedule_type('top=1,0,2'), ('top', [1.0, 0.0, 2.0]))
+
+    def test_invalid_cadence(self):
+        for value in ['top', 'unknown=5', 'top=a', 'top=1,2,3,4', 'top=0', 'top=-1', 'top=1,-1', 'top=1,0,0', 'top=1,0,-2']:
+            self.assertRaises(ArgumentTypeError, schedule_type, value)
+
+if __name__ == '__main__':
+    unittest.main()
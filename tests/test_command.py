@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+from argparse import Namespace
+from StringIO import StringIO
+from threading import Thread
+
+from tvb.command import AnrCommand, DumpheapLoopCommand
+from tests.test_hprof import write_hprof
+
+DUMP = '''--------- beginning of events
+12-31 23:58:01.100  1000  1234  1250 I am_anr  : [0,4321,com.example.app,1,Input dispatching timed out]
+'''
+NEW = '''01-01 00:00:05.200  1000  1234  1250 I am_anr  : [0,4400,com.example.app,1,Input dispatching timed out]
+'''
+
+class Log(object):
+    def __init__(self):
+        self.lines = []
+
+    def write(self, data, flush=True):
+        self.lines.extend(data.splitlines())
+
+    def close(self):
+        pass
+
+class Device(object):
+    device = 'dev1'
+
+    def __init__(self, dump):
+        self.dump = dump
+        self.log = Log()
+
+    def run(self, cmd):
+        return self.dump
+
+    def open_log(self, name):
+        return self.log
+
+class AnrCommandTest(unittest.TestCase):
+    def new(self, dump):
+        device = Device(dump)
+        return AnrCommand('anr', 'logcat -v threadtime -b events -s am_anr').new(device, Namespace(interval=1)), device
+
+    def test_replayed_events_are_skipped_across_the_new_year(self):
+        command, device = self.new(DUMP)
+        command.read(StringIO(DUMP + NEW), 1)
+        self.assertEqual(device.log.lines, NEW.splitlines())
+        self.assertTrue(command.pending is not None)
+
+    def test_empty_buffer(self):
+        command, device = self.new('')
+        command.read(StringIO(DUMP + NEW))
+        self.assertEqual(device.log.lines, (DUMP + NEW).splitlines()[1:])
+
+    def test_clock_set_back(self):
+        # the new event is older than the replayed one
+        command, device = self.new(NEW)
+        command.read(StringIO(NEW + DUMP), 1)
+        self.assertEqual(device.log.lines, DUMP.splitlines()[1:])
+
+class DumpheapLoopCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.device = Device('')
+        self.command = DumpheapLoopCommand('dumpheap').new(self.device, Namespace(interval=1, process_names=[], hprof='keep'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_summary_is_logged_by_the_next_execute(self):
+        path = os.path.join(self.dir, 'test.hprof')
+        write_hprof(path)
+        self.command.summarizer = Thread(target=self.command.summarize, args=('10/18 19:00:00', path))
+        self.command.summarizer.start()
+        self.command.summarizer.join()
+        self.assertEqual(self.device.log.lines, [])
+        self.command.execute()
+        self.assertEqual(self.device.log.lines[:2], ['>>10/18 19:00:00>>', 'TOTAL 156 5'])
+
+if __name__ == '__main__':
+    unittest.main()
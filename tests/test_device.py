@@ -0,0 +1,181 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from threading import Timer
+from time import time
+
+import tvb.device
+from tvb.device import Device, ShellSession, HEALTHY
+from tvb.metadata import DeviceMetadata
+
+# adb -s SERIAL shell [COMMAND] running the shell on the host
+FAKE_ADB = '''#!/bin/sh
+shift 3
+[ $# -eq 0 ] && exec sh 2>/dev/null
+exec sh -c "$*" 2>/dev/null
+'''
+
+class FakeAdbTestCase(unittest.TestCase):
+    def setUp(self):
+        self.bin = tempfile.mkdtemp()
+        adb = os.path.join(self.bin, 'adb')
+        with open(adb, 'w') as f:
+            f.write(FAKE_ADB)
+        os.chmod(adb, 0755)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = '%s%s%s' % (self.bin, os.pathsep, self.path)
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.bin)
+
+class ShellSessionTest(FakeAdbTestCase):
+    def setUp(self):
+        FakeAdbTestCase.setUp(self)
+        self.session = ShellSession('dev1')
+
+    def tearDown(self):
+        self.session.close()
+        FakeAdbTestCase.tearDown(self)
+
+    def test_output_and_exit_code(self):
+        self.assertEqual(self.session.execute('echo a; echo b'), ('a\nb', 0))
+        self.assertEqual(self.session.execute('echo c; exit 3'), ('c', 3))
+        self.assertEqual(self.session.execute('true'), ('', 0))
+
+    def test_output_without_trailing_newline(self):
+        self.assertEqual(self.session.execute('printf abc'), ('abc', 0))
+        self.assertEqual(self.session.execute('printf "a\\nb"; false'), ('a\nb', 1))
+        self.assertEqual(self.session.execute('echo next'), ('next', 0))
+
+    def test_dead_session_is_respawned(self):
+        self.session.spawn()
+        self.session.kill()
+        self.assertEqual(self.session.execute('echo alive'), ('alive', 0))
+
+class RunBatchTest(FakeAdbTestCase):
+    def setUp(self):
+        FakeAdbTestCase.setUp(self)
+        self.log_dir = tempfile.mkdtemp()
+        self.device = Device('dev1', self.log_dir)
+
+    def tearDown(self):
+        self.device.close()
+        shutil.rmtree(self.log_dir)
+        FakeAdbTestCase.tearDown(self)
+
+    def test_outputs_in_order(self):
+        self.assertEqual(self.device.run_batch(['echo a', 'true', 'echo b; echo c']), ['a', '', 'b\nc'])
+
+    def test_output_without_trailing_newline(self):
+        self.assertEqual(self.device.run_batch(['printf a', 'printf b', 'echo c']), ['a', 'b', 'c'])
+
+    def test_cancelled_command_is_not_a_failure(self):
+        timer = Timer(0.5, self.device.kill_session)
+        timer.start()
+        self.assertEqual(self.device.run('sleep 30 >/dev/null'), '')
+        timer.join()
+        self.assertEqual((self.device.state, self.device.recovering), (HEALTHY, None))
+        self.assertEqual(self.device.run('echo alive'), 'alive')
+
+# getprop ro.serialno prints the serial file of the fake adb
+FAKE_GETPROP = '''#!/bin/sh
+[ "$1" = ro.serialno ] && cat $(dirname $0)/serial
+[ "$1" = ro.product.model ] && echo Box
+exit 0
+'''
+
+class MetadataTest(FakeAdbTestCase):
+    def setUp(self):
+        FakeAdbTestCase.setUp(self)
+        getprop = os.path.join(self.bin, 'getprop')
+        with open(getprop, 'w') as f:
+            f.write(FAKE_GETPROP)
+        os.chmod(getprop, 0755)
+        self.log_dir = tempfile.mkdtemp()
+        self.metadata = DeviceMetadata(os.path.join(self.log_dir, 'devices.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+        FakeAdbTestCase.tearDown(self)
+
+    def create(self, serial):
+        with open(os.path.join(self.bin, 'serial'), 'w') as f:
+            f.write(serial)
+        self.metadata.set('dev1', {'core_num': 8, 'serial': 'A1', 'model': 'Cached', 'android': '9', 'ram': 1024})
+        device = Device('dev1', self.log_dir, metadata=self.metadata)
+        device.close()
+        return device.metadata
+
+    def test_same_serial_uses_the_cache(self):
+        self.assertEqual(self.create('A1')['model'], 'Cached')
+
+    def test_other_serial_is_probed(self):
+        metadata = self.create('B2')
+        self.assertEqual((metadata['serial'], metadata['model']), ('B2', 'Box'))
+        self.assertEqual(self.metadata.get('dev1'), metadata)
+
+class NetworkClient(object):
+    '''adb server of a network device that stops answering while it is down, until it is reconnected'''
+    def __init__(self):
+        self.down = False
+        self.hung = False
+        self.disconnects = 0
+
+    def devices(self):
+        return [('10.0.0.1:5555', 'device')]
+
+    def connect(self, address):
+        return 'connected to 10.0.0.1:5555'
+
+    def disconnect(self, address):
+        self.disconnects += 1
+        self.down = False
+        return 'disconnected'
+
+    def shell(self, serial, cmd=''):
+        if self.down:
+            return subprocess.Popen(['sh', '-c', 'exit 255'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        if self.hung:
+            return subprocess.Popen(['sleep', '30'], stdout=subprocess.PIPE)
+        if cmd:
+            return subprocess.Popen(['sh', '-c', cmd], stdout=subprocess.PIPE)
+        return subprocess.Popen(['sh'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+class RecoverTest(unittest.TestCase):
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.client = NetworkClient()
+        self.device = Device('10.0.0.1', self.log_dir, client=self.client)
+        self.probe_timeout = tvb.device.PROBE_TIMEOUT
+
+    def tearDown(self):
+        tvb.device.PROBE_TIMEOUT = self.probe_timeout
+        self.device.close()
+        shutil.rmtree(self.log_dir)
+
+    def recover(self):
+        self.device.fail()
+        self.device.recovering.join(10)
+        self.assertEqual(self.device.state, HEALTHY)
+
+    def test_answering_device_keeps_its_connection(self):
+        self.recover()
+        self.assertEqual(self.client.disconnects, 0)
+
+    def test_silent_device_is_reconnected(self):
+        self.client.down = True
+        self.recover()
+        self.assertEqual(self.client.disconnects, 1)
+
+    def test_probe_of_a_hung_device_times_out(self):
+        tvb.device.PROBE_TIMEOUT = 0.5
+        self.client.hung = True
+        before = time()
+        self.assertFalse(self.device.answers())
+        self.assertTrue(time() - before < 5)
+
+if __name__ == '__main__':
+    unittest.main()
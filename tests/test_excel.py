@@ -0,0 +1,66 @@
+import os
+import re
+import math
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from tvb.excel import Excel, downsample
+from tvb.store import MetricStore, format_timestamp
+
+CELL = re.compile(r'<c r="([A-Z]+\d+)"[^>]*>(?:<v>([^<]*)</v>|<is><t>([^<]*)</t></is>)')
+
+def read_cells(book_name, sheet):
+    '''{cell reference: value} of a sheet of the workbook'''
+    with zipfile.ZipFile(book_name) as book:
+        xml = book.read('xl/worksheets/sheet%d.xml' % sheet)
+    return dict((ref, value or text) for ref, value, text in CELL.findall(xml))
+
+class ExcelTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.book_name = os.path.join(self.dir, 'test.xlsx')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def get_store(self, rows):
+        store = MetricStore(['sin', 'cos'])
+        for i in range(rows):
+            store.append(format_timestamp(i), [math.sin(i / 50.0), math.cos(i / 50.0)])
+        return store
+
+    def test_reduced_copy_is_written(self):
+        store = self.get_store(5000)
+        excel = Excel(self.book_name, 200)
+        excel.add_sheet('test', 'time', 'value', ['timestamp'] + store.headings, store)
+        excel.save()
+        chart_rows = downsample(store, 3, 200)
+        cells = read_cells(self.book_name, 1)
+        self.assertEqual(cells['E1'], 'chart timestamp')
+        self.assertEqual(len([ref for ref in cells if ref.startswith('E')]), len(chart_rows) + 1)
+        self.assertEqual(len([ref for ref in cells if ref.startswith('A')]), 5001)
+        for i, index in enumerate(chart_rows):
+            self.assertEqual(cells['E%d' % (i + 2)], store.get_row(index)[0])
+            self.assertAlmostEqual(float(cells['F%d' % (i + 2)]), store.get_row(index)[1])
+        with zipfile.ZipFile(self.book_name) as book:
+            chart = book.read('xl/charts/chart1.xml')
+        self.assertIn('$F$2:$F$%d' % (len(chart_rows) + 1), chart)
+
+    def test_downsample_keeps_the_ends(self):
+        store = self.get_store(5000)
+        indexes = downsample(store, 3, 200)
+        self.assertTrue(len(indexes) <= 200)
+        self.assertEqual((indexes[0], indexes[-1]), (0, 4999))
+
+    def test_short_sheet_is_charted_in_full(self):
+        rows = [['a', 1], ['b', 2], ['c', 3]]
+        excel = Excel(self.book_name, 200)
+        excel.add_sheet('test', 'time', 'value', ['timestamp', 'value'], rows)
+        excel.save()
+        cells = read_cells(self.book_name, 1)
+        self.assertEqual(sorted(cells), ['A1', 'A2', 'A3', 'A4', 'B1', 'B2', 'B3', 'B4'])
+
+if __name__ == '__main__':
+    unittest.main()
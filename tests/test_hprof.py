@@ -0,0 +1,54 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from tvb.hprof import HprofHistogram, summarize
+
+def record(tag, body):
+    return struct.pack('>BII', tag, 0, len(body)) + body
+
+def write_hprof(path):
+    '''two classes with instances, one loaded class without, field and method name strings'''
+    data = 'JAVA PROFILE 1.0.3\0' + struct.pack('>IQ', 4, 0)
+    strings = {1: 'com.example.Leak', 2: 'java.lang.Object[]', 3: 'com.example.Unused', 4: 'mCount', 5: 'onCreate'}
+    data += ''.join(record(0x01, struct.pack('>I', string_id) + text) for string_id, text in sorted(strings.items()))
+    data += ''.join(record(0x02, struct.pack('>IIII', serial, 100 + string_id, 0, string_id)) for serial, string_id in enumerate([1, 2, 3]))
+    heap = struct.pack('>BI', 0xFF, 7)
+    # instance dump: id, stack serial, class id, field bytes
+    heap += (struct.pack('>BIIII', 0x21, 1000, 0, 101, 12) + '\0' * 12) * 3
+    # object array dump: id, stack serial, length, array class id
+    heap += struct.pack('>BIIII', 0x22, 1001, 0, 5, 102) + '\0' * 20
+    # primitive array dump: id, stack serial, length, byte type
+    heap += struct.pack('>BIIIB', 0x23, 1002, 0, 100, 8) + '\0' * 100
+    data += record(0x1C, heap) + record(0x2C, '')
+    with open(path, 'wb') as f:
+        f.write(data)
+
+class HprofTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.hprof')
+        write_hprof(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_histogram(self):
+        histogram = HprofHistogram(self.path)
+        self.assertEqual(histogram.get_histogram(), [(100, 1, 'byte[]'), (36, 3, 'com.example.Leak'), (20, 1, 'java.lang.Object[]')])
+
+    def test_only_names_of_instantiated_classes_are_kept(self):
+        self.assertEqual(sorted(HprofHistogram(self.path).names.values()), ['com.example.Leak', 'java.lang.Object[]'])
+
+    def test_summarize(self):
+        self.assertEqual(summarize(self.path, 2), 'TOTAL 156 5\n100 1 byte[]\n36 3 com.example.Leak')
+
+    def test_not_a_hprof(self):
+        with open(self.path, 'wb') as f:
+            f.write('PK\0')
+        self.assertRaises(ValueError, HprofHistogram, self.path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+
+import tvb.info
+from tvb.info import CpuInfo
+
+SAMPLE = '''>>10/18 19:%02d:%02d>>
+Load: 1.0 / 1.0 / 1.0
+CPU usage from 5000ms to 1ms ago:
+  %d%% 1234/com.example.app: 8%% user + 4%% kernel / faults: 120 minor
+  +0.5%% 4321/com.example.started: 0.5%% user + 0%% kernel
+  -3%% 567/com.example.died: 2%% user + 1%% kernel
+%s20%% TOTAL: 12%% user + 8%% kernel + 0%% iowait
+'''
+
+def get_samples(count, padding=''):
+    return ''.join(SAMPLE % (i / 60, i % 60, i % 50, padding) for i in range(count))
+
+class CpuInfoTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, text):
+        with open(os.path.join(self.dir, 'cpuinfo.txt'), 'wb') as f:
+            f.write(text)
+
+    def get_sheets(self, process_names):
+        return dict((sheet[0], list(sheet[4])) for sheet in CpuInfo(self.dir, 'cpuinfo.txt', process_names, 4).get_sheet_list())
+
+    def test_process_usage(self):
+        self.write(get_samples(4))
+        sheets = self.get_sheets(['com.example.app'])
+        # the last sample may still be written, it is left out
+        self.assertEqual(sheets['cpuinfo.usage.app'], [['10/18 19:00:00', 0.0, 2.0, 1.0], ['10/18 19:00:01', 0.25, 2.0, 1.0], ['10/18 19:00:02', 0.5, 2.0, 1.0]])
+        self.assertEqual(sheets['cpuinfo.load'][0], ['10/18 19:00:00', 1.0, 1.0, 1.0])
+
+    def test_signed_usage(self):
+        self.write(get_samples(2))
+        sheets = self.get_sheets(['com.example.started', 'com.example.died'])
+        self.assertEqual(sheets['cpuinfo.usage.started'], [['10/18 19:00:00', 0.125, 0.125, 0.0]])
+        self.assertEqual(sheets['cpuinfo.usage.died'], [['10/18 19:00:00', 0.75, 0.5, 0.25]])
+
+class MapWindowTest(CpuInfoTest):
+    def setUp(self):
+        CpuInfoTest.setUp(self)
+        self.window = tvb.info.MAP_WINDOW
+
+    def tearDown(self):
+        tvb.info.MAP_WINDOW = self.window
+        CpuInfoTest.tearDown(self)
+
+    def get_windowed_sheets(self, process_names):
+        tvb.info.MAP_WINDOW = mmap.ALLOCATIONGRANULARITY
+        try:
+            return self.get_sheets(process_names)
+        finally:
+            tvb.info.MAP_WINDOW = self.window
+
+    def test_samples_across_windows(self):
+        self.write(get_samples(300))
+        sheets = self.get_sheets(['com.example.app'])
+        self.assertEqual(len(sheets['cpuinfo.usage.app']), 299)
+        self.assertEqual(self.get_windowed_sheets(['com.example.app']), sheets)
+
+    def test_sample_larger_than_window(self):
+        self.write(get_samples(5, 'filler line\n' * (mmap.ALLOCATIONGRANULARITY / 4)))
+        sheets = self.get_sheets(['com.example.app'])
+        self.assertEqual(len(sheets['cpuinfo.usage.app']), 4)
+        self.assertEqual(self.get_windowed_sheets(['com.example.app']), sheets)
+
+if __name__ == '__main__':
+    unittest.main()
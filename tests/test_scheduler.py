@@ -0,0 +1,40 @@
+import unittest
+from argparse import Namespace
+
+from tvb.command import LoopCommand, DumpheapLoopCommand
+from tvb.scheduler import Scheduler
+
+class SchedulerTest(unittest.TestCase):
+    def new(self, command):
+        return command.new(None, Namespace(interval=1, process_names=['com.example.app']))
+
+    def test_cadence(self):
+        fast, slow = self.new(LoopCommand('fast', 'true', period=1)), self.new(LoopCommand('slow', 'true', period=3))
+        scheduler = Scheduler([fast, slow], start=0)
+        runs = []
+        for now in range(7):
+            for base, command in scheduler.pop_due(now):
+                runs.append((now, command.name))
+                scheduler.reschedule(base, command, now)
+        self.assertEqual([now for now, name in runs if name == 'slow'], [0, 3, 6])
+        self.assertEqual([now for now, name in runs if name == 'fast'], range(7))
+
+    def test_late_run_is_not_repeated(self):
+        command = self.new(LoopCommand('top', 'true', period=1))
+        scheduler = Scheduler([command], start=0)
+        base, command = scheduler.pop_due(0)[0]
+        self.assertEqual(scheduler.reschedule(base, command, 3.5), 2.5)
+        self.assertEqual(scheduler.next_due(), 3.5)
+
+    def test_dumpheap_waits_a_period(self):
+        command = self.new(DumpheapLoopCommand('dumpheap', period=60))
+        scheduler = Scheduler([command], start=0)
+        # dumped two intervals before the pull, pulled one period after the start
+        self.assertEqual(scheduler.next_due(), 58)
+        base, command = scheduler.pop_due(58)[0]
+        command.dumping = True
+        scheduler.reschedule(base, command, 58)
+        self.assertEqual(scheduler.next_due(), 60)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+from tvb.sink import MetricSink
+from tvb.store import MetricStore
+
+class MetricSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.sink = MetricSink(self.dir, 'cpuinfo', 'csv', ['com.example.app'], 4)
+
+    def tearDown(self):
+        self.sink.close()
+        shutil.rmtree(self.dir)
+
+    def read(self, name):
+        with open(os.path.join(self.dir, 'metrics', name), 'rb') as f:
+            return list(csv.reader(f))
+
+    def test_samples_are_written_by_close(self):
+        for second in range(3):
+            self.sink.handle('10/18 19:00:%02d' % second, 'Load: 1.0 / 2.0 / 3.0\n')
+        self.sink.close()
+        self.assertEqual([row[0] for row in self.read('cpuinfo.load.csv')[1:]], ['10/18 19:00:00', '10/18 19:00:01', '10/18 19:00:02'])
+
+    def test_new_column_starts_a_new_file(self):
+        store = MetricStore(['a'])
+        store.append('10/18 19:00:00', [1])
+        self.sink.write('top.cpu', ['timestamp', 'a'], store)
+        store.add_heading('b')
+        store.append('10/18 19:00:01', [2, 3])
+        self.sink.write('top.cpu', ['timestamp', 'a', 'b'], store)
+        self.assertEqual(self.read('top.cpu.csv'), [['timestamp', 'a', 'b'], ['10/18 19:00:01', '2.0', '3.0']])
+        segments = [name for name in os.listdir(os.path.join(self.dir, 'metrics')) if name.startswith('top.cpu.') and name != 'top.cpu.csv']
+        self.assertEqual(len(segments), 1)
+        self.assertEqual(self.read(segments[0]), [['timestamp', 'a'], ['10/18 19:00:00', '1.0']])
+
+if __name__ == '__main__':
+    unittest.main()
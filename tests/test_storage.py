@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tvb.storage import LogTail
+
+class LogTailTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.tail = LogTail(self.dir, 'logcat_')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, text):
+        with open(os.path.join(self.dir, name), 'ab') as f:
+            f.write(text)
+
+    def test_appended_lines(self):
+        self.write('logcat_1.txt', 'a\nb')
+        self.write('other.txt', 'x\n')
+        self.assertEqual(self.tail.read(), ['a'])
+        self.write('logcat_1.txt', 'c\nd\n')
+        self.assertEqual(self.tail.read(), ['bc', 'd'])
+        self.assertEqual(self.tail.read(), [])
+
+    def test_rotated_log(self):
+        self.write('logcat_1.txt', 'a\n')
+        self.assertEqual(self.tail.read(), ['a'])
+        self.write('logcat_1.txt', 'b\n')
+        os.rename(os.path.join(self.dir, 'logcat_1.txt'), os.path.join(self.dir, 'logcat_1.txt.1'))
+        self.write('logcat_1.txt', 'c\n')
+        self.assertEqual(sorted(self.tail.read()), ['b', 'c'])
+
+    def test_deleted_logs_are_forgotten(self):
+        self.write('logcat_1.txt', 'a\n')
+        self.write('logcat_2.txt', 'b\n')
+        self.assertEqual(sorted(self.tail.read()), ['a', 'b'])
+        os.remove(os.path.join(self.dir, 'logcat_1.txt'))
+        self.assertEqual(self.tail.read(), [])
+        self.assertEqual(self.tail.files.keys(), [os.stat(os.path.join(self.dir, 'logcat_2.txt')).st_ino])
+
+if __name__ == '__main__':
+    unittest.main()
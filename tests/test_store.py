@@ -0,0 +1,59 @@
+# encoding: utf-8
+import cPickle as pickle
+import struct
+import sys
+import unittest
+from cStringIO import StringIO
+
+from tvb.store import MetricStore, parse_timestamp, format_timestamp
+
+class MetricStoreTest(unittest.TestCase):
+    def get_store(self):
+        store = MetricStore(['pss', u'naïve'])
+        store.append('10/18 19:00:00', [1.5, None])
+        store.append('not a time', [None, 2.0])
+        store.append('02/29 23:59:59', [3.0, 4.25])
+        return store
+
+    def dump(self, store):
+        f = StringIO()
+        store.dump(f)
+        return f.getvalue()
+
+    def test_dump_and_load(self):
+        store = self.get_store()
+        loaded = MetricStore.load(StringIO(self.dump(store)))
+        self.assertEqual(loaded.headings, ['pss', u'naïve'])
+        self.assertEqual(list(loaded), list(store))
+        self.assertEqual(list(loaded), [['10/18 19:00:00', 1.5, ''], ['not a time', '', 2.0], ['02/29 23:59:59', 3.0, 4.25]])
+
+    def test_leap_day(self):
+        seconds = parse_timestamp('02/29 23:59:59')
+        self.assertEqual(seconds, (31 + 29) * 86400 - 1)
+        self.assertEqual(format_timestamp(seconds), '02/29 23:59:59')
+        self.assertEqual(self.get_store().labels, {1: 'not a time'})
+
+    def test_empty_store(self):
+        loaded = MetricStore.load(StringIO(self.dump(MetricStore(['a']))))
+        self.assertEqual((loaded.headings, len(loaded)), (['a'], 0))
+
+    def test_other_byte_order(self):
+        store = self.get_store()
+        for array in [store.timestamps] + store.columns:
+            array.byteswap()
+        data = self.dump(store)
+        # flip the byte order flag of the header
+        data = data[:5] + struct.pack('<B', sys.byteorder != 'little') + data[6:]
+        self.assertEqual(list(MetricStore.load(StringIO(data))), list(self.get_store()))
+
+    def test_not_a_store(self):
+        self.assertRaises(ValueError, MetricStore.load, StringIO('XXXX' + '\0' * 14))
+
+    def test_pickle(self):
+        store = self.get_store()
+        selected = store.select(['pss'])
+        loaded = pickle.loads(pickle.dumps(selected, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(list(loaded), [row[:2] for row in store])
+
+if __name__ == '__main__':
+    unittest.main()
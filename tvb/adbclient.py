@@ -0,0 +1,277 @@
+# encoding: utf-8
+'''
+@author:     Juncheng Chen
+
+@copyright:  1999-2015 Alibaba.com. All rights reserved.
+
+@license:    Apache Software License 2.0
+
+@contact:    juncheng.cjc@outlook.com
+'''
+import os
+import socket
+import struct
+import subprocess
+from threading import Event
+from time import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+ADB_MODES = ['binary', 'native']
+DEFAULT_PORT = 5037
+SYNC_DATA_MAX = 64 * 1024
+TIMEOUT = 10
+
+class AdbError(Exception):
+    pass
+
+class AdbStream(object):
+    '''Read side of an adb service, ends the process at the end of the stream.'''
+    def __init__(self, process, f):
+        self.process = process
+        self.file = f
+
+    def read(self, size=-1):
+        try:
+            data = self.file.read(size)
+        except (socket.error, ValueError):
+            data = ''
+        if not data or (size < 0):
+            self.process.finish(0)
+        return data
+
+    def readline(self):
+        try:
+            line = self.file.readline()
+        except (socket.error, ValueError):
+            line = ''
+        if not line:
+            self.process.finish(0)
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def close(self):
+        self.file.close()
+
+class AdbProcess(object):
+    '''Popen-like view of an adb shell service, returncode is 0 at the end of the stream and 255 when adb failed.'''
+    def __init__(self, sock=None, error=None):
+        self.socket = sock
+        self.error = error
+        self.returncode = None
+        self.done = Event()
+        if sock is None:
+            self.stdin = self.stdout = None
+            self.finish(255)
+        else:
+            self.stdin = sock.makefile('wb')
+            self.stdout = AdbStream(self, sock.makefile('rb'))
+
+    def finish(self, returncode):
+        if self.returncode is None:
+            self.returncode = returncode
+        self.done.set()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        self.done.wait()
+        return self.returncode
+
+    def communicate(self, input=None):
+        if self.stdout is None:
+            return '', None
+        if input:
+            self.stdin.write(input)
+            self.stdin.flush()
+        return self.stdout.read(), None
+
+    def kill(self):
+        if self.socket is not None:
+            try:
+                self.socket.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self.socket.close()
+        self.finish(-9)
+
+    terminate = kill
+
+class AdbClient(object):
+    '''Client of the adb host protocol spoken by the local adb server.
+
+    Every request is a 4 hex digit length and a payload on a new
+    connection, answered by OKAY or FAIL. Device services first switch
+    the connection to the device with host:transport.
+    '''
+    def __init__(self, host='127.0.0.1', port=None):
+        self.host = host
+        self.port = port or int(os.environ.get('ANDROID_ADB_SERVER_PORT', DEFAULT_PORT))
+
+    def open(self):
+        sock = socket.create_connection((self.host, self.port), TIMEOUT)
+        return sock
+
+    def send(self, sock, payload):
+        sock.sendall('%04x%s' % (len(payload), payload))
+        status = self.recv(sock, 4)
+        if status == 'OKAY':
+            return
+        if status == 'FAIL':
+            raise AdbError(self.recv_string(sock))
+        raise AdbError('unexpected adb response %r' % status)
+
+    def recv(self, sock, size):
+        data = []
+        while size:
+            chunk = sock.recv(size)
+            if not chunk:
+                raise AdbError('adb server closed the connection')
+            data.append(chunk)
+            size -= len(chunk)
+        return ''.join(data)
+
+    def recv_string(self, sock):
+        return self.recv(sock, int(self.recv(sock, 4), 16))
+
+    def query(self, payload):
+        '''host request answered by a length prefixed string'''
+        sock = self.open()
+        try:
+            self.send(sock, payload)
+            return self.recv_string(sock)
+        finally:
+            sock.close()
+
+    def version(self):
+        return int(self.query('host:version'), 16)
+
+    def devices(self):
+        '''return [(serial, state)]'''
+        return [tuple(line.split('\t')[:2]) for line in self.query('host:devices').splitlines() if '\t' in line]
+
+    def connect(self, address):
+        return self.query('host:connect:%s' % address)
+
+    def disconnect(self, address):
+        return self.query('host:disconnect:%s' % address)
+
+    def transport(self, serial):
+        sock = self.open()
+        try:
+            self.send(sock, 'host:transport:%s' % serial)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def shell(self, serial, cmd=''):
+        '''run cmd, or an interactive shell fed through stdin when cmd is empty'''
+        try:
+            sock = self.transport(serial)
+            try:
+                self.send(sock, 'shell:%s' % cmd)
+            except Exception:
+                sock.close()
+                raise
+            # a shell runs as long as it likes
+            sock.settimeout(None)
+            return AdbProcess(sock)
+        except (AdbError, socket.error), e:
+            logger.error('adb shell %s on %s failed: %s' % (cmd, serial, e))
+            return AdbProcess(error=str(e))
+
+    def sync(self, serial):
+        sock = self.transport(serial)
+        try:
+            self.send(sock, 'sync:')
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def pull(self, serial, remote, local, started=None):
+        '''copy remote to local with the sync RECV request, return whether it succeeded
+
+        started is called with the sync socket, shutting it down aborts the copy.
+        '''
+        try:
+            sock = self.sync(serial)
+        except (AdbError, socket.error), e:
+            logger.error('adb pull %s failed: %s' % (remote, e))
+            return False
+        if started:
+            started(sock)
+        temp = '%s.tmp' % local
+        try:
+            sock.sendall('RECV' + struct.pack('<I', len(remote)) + remote)
+            with open(temp, 'wb') as f:
+                while True:
+                    header = self.recv(sock, 8)
+                    kind, size = header[:4], struct.unpack('<I', header[4:])[0]
+                    if kind == 'DATA':
+                        f.write(self.recv(sock, size))
+                    elif kind == 'DONE':
+                        break
+                    elif kind == 'FAIL':
+                        raise AdbError(self.recv(sock, size))
+                    else:
+                        raise AdbError('unexpected sync response %r' % kind)
+            os.rename(temp, local)
+            sock.sendall('QUIT' + struct.pack('<I', 0))
+            return True
+        except (AdbError, socket.error, IOError, OSError), e:
+            logger.error('adb pull %s failed: %s' % (remote, e))
+            if os.path.exists(temp):
+                os.remove(temp)
+            return False
+        finally:
+            sock.close()
+
+    def push(self, serial, local, remote, mode=0644):
+        '''copy local to remote with the sync SEND request, return whether it succeeded'''
+        try:
+            sock = self.sync(serial)
+        except (AdbError, socket.error), e:
+            logger.error('adb push %s failed: %s' % (local, e))
+            return False
+        try:
+            target = '%s,%d' % (remote, mode)
+            sock.sendall('SEND' + struct.pack('<I', len(target)) + target)
+            with open(local, 'rb') as f:
+                for data in iter(lambda: f.read(SYNC_DATA_MAX), ''):
+                    sock.sendall('DATA' + struct.pack('<I', len(data)) + data)
+            sock.sendall('DONE' + struct.pack('<I', int(time())))
+            header = self.recv(sock, 8)
+            if header[:4] != 'OKAY':
+                raise AdbError(self.recv(sock, struct.unpack('<I', header[4:])[0]) if header[:4] == 'FAIL' else 'unexpected sync response %r' % header[:4])
+            sock.sendall('QUIT' + struct.pack('<I', 0))
+            return True
+        except (AdbError, socket.error, IOError), e:
+            logger.error('adb push %s failed: %s' % (local, e))
+            return False
+        finally:
+            sock.close()
+
+def get_client(mode):
+    '''AdbClient when mode is native and the adb server answers, None to keep using the adb binary'''
+    if mode != 'native':
+        return None
+    client = AdbClient()
+    for attempt in range(2):
+        try:
+            logger.debug('adb server version %s' % client.version())
+            return client
+        except (AdbError, socket.error), e:
+            if attempt == 0:
+                logger.debug('adb server not reachable: %s, start it' % e)
+                try:
+                    subprocess.call(['adb', 'start-server'])
+                except OSError:
+                    pass
+    logger.warning('adb server not reachable on port %s, fall back to the adb binary' % client.port)
+    return None
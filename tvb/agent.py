@@ -0,0 +1,151 @@
+# encoding: utf-8
+'''
+@author:     Juncheng Chen
+
+@copyright:  1999-2015 Alibaba.com. All rights reserved.
+
+@license:    Apache Software License 2.0
+
+@contact:    juncheng.cjc@outlook.com
+'''
+import os
+import re
+
+from tvb.command import Command
+
+import logging
+logger = logging.getLogger(__name__)
+
+AGENT_DIR = '/mnt/sdcard/tvb_agent'
+# the ring is AGENT_RING_KEEP files of about AGENT_RING_SIZE bytes
+AGENT_RING_SIZE = 64 * 1024
+AGENT_RING_KEEP = 64
+
+AGENT_HEAD = '''DIR=%(dir)s
+mkdir -p $DIR
+echo $$ > $DIR/pid
+gen=$(ls $DIR | sed -n 's/^ring\\.\\([0-9]*\\)$/\\1/p' | sort -n | tail -n 1)
+gen=$((${gen:-0} + 1))
+now=$(date +%%s)
+'''
+# the terminator is on its own line, the output may not end with a newline
+AGENT_PROBE = '''  if [ $now -ge $next_%(index)d ]; then
+    { echo ">>TVB %(name)s $(date '+%%m/%%d %%H:%%M:%%S')"; %(command)s; echo; echo "<<TVB"; } </dev/null >> $DIR/ring.$gen 2>/dev/null
+    next_%(index)d=$((next_%(index)d + %(period)d))
+    [ $next_%(index)d -le $now ] && next_%(index)d=$((now + %(period)d))
+  fi
+'''
+AGENT_TAIL = '''  if [ -f $DIR/ring.$gen ] && [ $(wc -c < $DIR/ring.$gen) -ge %(size)d ]; then
+    rm -f $DIR/ring.$((gen - %(keep)d))
+    gen=$((gen + 1))
+  fi
+  sleep 1
+done
+'''
+
+RECORD = re.compile(r'^>>TVB (?P<name>\S+) (?P<timestamp>[^\n]*)\n(?P<output>.*?)^<<TVB\n', re.MULTILINE | re.DOTALL)
+
+def build_script(commands):
+    '''shell loop sampling every command on the device at its own period, records go to the ring'''
+    script = [AGENT_HEAD % {'dir': AGENT_DIR}]
+    script += ['next_%d=$now\n' % i for i in range(len(commands))]
+    script.append('while true; do\n  now=$(date +%s)\n')
+    for i, command in enumerate(commands):
+        script.append(AGENT_PROBE % {'index': i, 'name': command.name, 'command': command.command, 'period': max(int(round(command.period)), 1)})
+    script.append(AGENT_TAIL % {'size': AGENT_RING_SIZE, 'keep': AGENT_RING_KEEP})
+    return ''.join(script)
+
+class AgentCommand(Command):
+    '''Sample the loop commands of a device on the device itself and pull the records in bulk.
+
+    The agent keeps sampling through adb or network drops, the records
+    are handed to the loop commands as if they had run them, so logs,
+    sinks and reports do not change.
+    '''
+    def __init__(self, commands, pull_interval):
+        Command.__init__(self, 'agent', period=pull_interval, max_runtime=max(pull_interval, 60))
+        self.commands = dict((command.name, command) for command in commands)
+        self.device = commands[0].device
+        self.args = commands[0].args
+        self.script = build_script(commands)
+        self.started = False
+        # ring file and offset the next pull starts from
+        self.gen = 0
+        self.offset = 0
+
+    def start(self):
+        local = os.path.join(self.device.log_dir, 'agent.sh')
+        with open(local, 'w') as f:
+            f.write(self.script)
+        if not self.started:
+            # a fresh run, drop what an earlier run may have left behind
+            self.device.run('kill $(cat %s/pid) 2>/dev/null; rm -rf %s' % (AGENT_DIR, AGENT_DIR))
+        self.device.run('mkdir -p %s' % AGENT_DIR)
+        self.device.push(local, '%s/agent.sh' % AGENT_DIR)
+        logger.info('%s start agent' % self.device.device)
+        self.device.get_process_stdout(self.device.shell('nohup sh %s/agent.sh >/dev/null 2>&1 &' % AGENT_DIR))
+        self.started = True
+
+    def poll(self):
+        '''return (ring files on the device, whether the agent is running)'''
+        lines = self.device.run('ls %s; kill -0 $(cat %s/pid) 2>/dev/null && echo TVB_ALIVE' % (AGENT_DIR, AGENT_DIR)).splitlines()
+        gens = sorted(int(line[5:]) for line in lines if line.startswith('ring.') and line[5:].isdigit())
+        return gens, 'TVB_ALIVE' in lines
+
+    def execute(self):
+        if not self.started:
+            self.start()
+            return
+        gens, alive = self.poll()
+        if gens:
+            self.pull(gens)
+        if not alive:
+            logger.error('%s agent died, restart it' % self.device.device)
+            self.start()
+
+    def pull(self, gens):
+        if gens[0] > self.gen and self.gen:
+            logger.error('%s agent ring overrun, records before ring %d are lost' % (self.device.device, gens[0]))
+        local = os.path.join(self.device.log_dir, '.agent.ring')
+        for gen in gens:
+            if gen < self.gen:
+                continue
+            if os.path.exists(local):
+                os.remove(local)
+            self.device.pull('%s/ring.%d' % (AGENT_DIR, gen), local)
+            if not os.path.exists(local):
+                logger.error('%s pull agent ring %d failed' % (self.device.device, gen))
+                return
+            with open(local, 'rb') as f:
+                data = f.read()
+            os.remove(local)
+            offset = self.offset if gen == self.gen else 0
+            for m in RECORD.finditer(data, offset):
+                command = self.commands.get(m.group('name'))
+                if command:
+                    command.handle(m.group('timestamp'), m.group('output').strip())
+                offset = m.end()
+            if gen == gens[-1]:
+                # the agent may still be writing the newest ring
+                self.gen, self.offset = gen, offset
+            else:
+                self.gen, self.offset = gen + 1, 0
+
+    def kill(self):
+        Command.kill(self)
+        self.device.kill_session()
+
+    def clean(self):
+        if self.started:
+            gens, alive = self.poll()
+            if gens:
+                self.pull(gens)
+            logger.info('%s stop agent' % self.device.device)
+            self.device.run('kill $(cat %s/pid); rm -rf %s' % (AGENT_DIR, AGENT_DIR))
+            self.started = False
+        for command in self.commands.itervalues():
+            command.clean()
+
+    def close(self):
+        for command in self.commands.itervalues():
+            command.close()
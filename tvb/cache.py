@@ -0,0 +1,62 @@
+# encoding: utf-8
+'''
+@author:     Juncheng Chen
+
+@copyright:  1999-2015 Alibaba.com. All rights reserved.
+
+@license:    Apache Software License 2.0
+
+@contact:    juncheng.cjc@outlook.com
+'''
+import os
+import cPickle as pickle
+
+import logging
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 3
+
+class ParseCache(object):
+    '''Plugin states of a raw log parsed up to an offset, stored next to it as .<file name>.cache'''
+    def __init__(self, path):
+        self.path = path
+        self.cache_path = os.path.join(os.path.dirname(path), '.%s.cache' % os.path.basename(path))
+
+    def get_identity(self):
+        # the first sample header does not change while the log is appended
+        st = os.stat(self.path)
+        with open(self.path, 'rb') as f:
+            return st.st_dev, st.st_ino, f.readline()
+
+    def is_sample_start(self, offset):
+        if offset == 0:
+            return True
+        if os.path.getsize(self.path) < offset + 2:
+            return False
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return f.read(2) == '>>'
+
+    def load(self, params):
+        '''return (offset, {plugin key: state}), (0, {}) when there is no usable cache'''
+        try:
+            with open(self.cache_path, 'rb') as f:
+                cache = pickle.load(f)
+        except Exception:
+            return 0, {}
+        if cache.get('version') != CACHE_VERSION or cache.get('params') != params or cache.get('identity') != self.get_identity() \
+                or not self.is_sample_start(cache.get('offset', 0)):
+            logger.debug('cache of %s is stale' % self.path)
+            return 0, {}
+        logger.debug('cache of %s parsed up to %s' % (self.path, cache['offset']))
+        return cache['offset'], cache['plugins']
+
+    def save(self, params, offset, plugins):
+        cache = {'version': CACHE_VERSION, 'params': params, 'identity': self.get_identity(), 'offset': offset, 'plugins': plugins}
+        temp_path = '%s.tmp' % self.cache_path
+        try:
+            with open(temp_path, 'wb') as f:
+                pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(temp_path, self.cache_path)
+        except (IOError, OSError), e:
+            logger.error('save cache %s failed: %s' % (self.cache_path, e))
@@ -13,12 +13,16 @@ import sys
 import os
 from argparse import ArgumentParser
 from argparse import RawDescriptionHelpFormatter
-from time import sleep, time
-from threading import Timer
+from argparse import ArgumentTypeError
 
-from tvb.command import support_commands, default_commands
+from tvb.command import support_commands, default_commands, COMMAND_CONFIG
 from tvb.config import Config
+from tvb.collector import Collector
 from tvb.report import Report
+from tvb.sink import SINK_FORMATS
+from tvb.storage import COMPRESSORS
+from tvb.adbclient import ADB_MODES
+from tvb.hprof import HPROF_MODES
 
 import logging
 logger = logging.getLogger(__name__)
@@ -44,6 +48,19 @@ class CLIError(Exception):
     def __unicode__(self):
         return self.msg
 
+def schedule_type(value):
+    try:
+        name, cadence = value.split('=', 1)
+        values = [float(v) if v else None for v in cadence.split(',')]
+    except ValueError:
+        raise ArgumentTypeError('invalid cadence %s, expect NAME=PERIOD[,JITTER[,MAX_RUNTIME]]' % value)
+    if name not in COMMAND_CONFIG or len(values) > 3:
+        raise ArgumentTypeError('invalid cadence %s, expect NAME=PERIOD[,JITTER[,MAX_RUNTIME]]' % value)
+    period, jitter, max_runtime = values + [None] * (3 - len(values))
+    if (period is not None and period <= 0) or (jitter is not None and jitter < 0) or (max_runtime is not None and max_runtime <= 0):
+        raise ArgumentTypeError('invalid cadence %s, PERIOD and MAX_RUNTIME must be positive, JITTER not negative' % value)
+    return name, values
+
 def main(argv=None): # IGNORE:C0111
     '''Command line options.'''
 
@@ -74,8 +91,23 @@ USAGE
         parser.add_argument('-l', '--log', dest="log_dir", help=u"specify the file path where to store logs", default=os.path.abspath('.'), metavar="log path", nargs='?')
         parser.add_argument('-t', '--time', dest="time", type=float, help=u"execution time, unit(minutes)", default=-1, metavar="minutes", nargs='?')
         parser.add_argument('-i', '--interval', dest="interval", type=int, help=u"time interval of command, unit(seconds), default %(default)s seconds", default=10, metavar="seconds", nargs='?')
+        parser.add_argument('--adb', dest="adb", choices=ADB_MODES, help=u"run the adb binary for every call, or talk to the adb server directly, default %(default)s", default='binary')
+        parser.add_argument('--refresh-devices', dest="refresh_devices", action="store_true", help=u"probe the core number, model, Android version and RAM of every device again instead of reading ~/.tvb/devices.json")
+        parser.add_argument('--batch', dest="batch", action="store_true", help=u"sample all loop commands of a device in one adb round trip")
+        parser.add_argument('--agent', dest="agent", action="store_true", help=u"sample the loop commands on the device with a pushed shell agent and pull its records in bulk")
+        parser.add_argument('--pull-interval', dest="pull_interval", type=int, help=u"time interval of pulling the agent records, unit(seconds), default %(default)s seconds", default=30, metavar="seconds")
+        parser.add_argument('--schedule', dest="schedule", type=schedule_type, help=u"cadence of a command, NAME=PERIOD[,JITTER[,MAX_RUNTIME]], unit(seconds), e.g. temp0=1 meminfo=60,5,30", metavar="cadence", nargs='+')
+        parser.add_argument('--compress', dest="compress", choices=COMPRESSORS, help=u"write the raw logs through a streaming compressor, reports read them transparently")
+        parser.add_argument('--rotate-size', dest="rotate_size", type=float, help=u"start a new segment of a log once it reaches this size, unit(MB)", metavar="MB")
+        parser.add_argument('--rotate-time', dest="rotate_time", type=float, help=u"start a new segment of a log after this time, unit(minutes)", metavar="minutes")
+        parser.add_argument('--retention-size', dest="retention_size", type=float, help=u"delete the oldest rotated segments once the logs of a device exceed this size, unit(GB)", metavar="GB")
+        parser.add_argument('--retention-time', dest="retention_time", type=float, help=u"delete rotated segments older than this, unit(hours)", metavar="hours")
+        parser.add_argument('--sink', dest="sink", choices=SINK_FORMATS, help=u"parse every sample while collecting and append its rows to <device>/metrics/<sheet>.<format>")
         parser.add_argument('-p', '--process', dest="process_names", help=u"specify process names to generate line chart", metavar="process names", nargs='*')
         
+        parser.add_argument('--top', dest="top", type=int, help=u"chart the N processes with the highest cpu or pss together, all processes when N is 0 or omitted", metavar="N", const=0, nargs='?')
+        
+        parser.add_argument('--hprof', dest="hprof", choices=HPROF_MODES, help=u"what to do with a heap dump once it is summarized to dumpheap.txt, default %(default)s", default='keep')
         parser.add_argument('-m', '--monkey', dest="monkey", help=u"monkey will only allow the system to visit activities within those packages", metavar="packages", nargs='*')
         parser.add_argument('-b', '--blacklist', dest="blacklist", help=u"monkey will not allow the system to visit activities within those packages", metavar="packages", nargs='+')
         parser.add_argument('-s', '--script', dest="script", help=u"monkey will repeat run according the script", metavar="script_path", nargs='?')
@@ -90,12 +122,18 @@ USAGE
         parser.add_argument('--pct-appswitch', dest="pct-appswitch", type=int, help=u'adjust percentage of activity launches, default 9', metavar="percent", nargs='?')
         parser.add_argument('--pct-anyevent', dest="pct-anyevent", type=int, help=u'adjust percentage of other types of events, default 1', metavar="percent", nargs='?')
         
+        parser.add_argument("-j", "--jobs", dest="jobs", type=int, help=u"number of processes generating the report, default %(default)s", default=1, metavar="jobs", nargs='?')
+        parser.add_argument("--no-cache", dest="cache", action="store_false", help=u"parse the raw logs from scratch instead of reusing the parse cache stored next to them")
+        parser.add_argument("--export-metrics", dest="export", action="store_true", help=u"also write every sheet as a binary metric store to <device>/metrics")
+        parser.add_argument("--chart-points", dest="chart_points", type=int, help=u"most points drawn per chart, longer sheets are charted from a shape preserving reduced copy of the data, 0 to chart every row, default %(default)s", default=2000, metavar="points", nargs='?')
         parser.add_argument("-r", "--report", dest="report", help=u"regenerate excel report", metavar="report path", nargs='?')
         parser.add_argument("-v", "--verbose", dest="verbose", action="count", default=0, help=u"verbose level")
         parser.add_argument('-V', '--version', action='version', help=u"show version and exit", version=program_version_message)
 
         # Process arguments
         args = parser.parse_args()
+        if args.schedule:
+            args.schedule = dict(args.schedule)
         logging.basicConfig(level=logging.INFO if args.verbose == 0 else logging.DEBUG,
                     format='%(asctime)s %(levelname)-5s %(message)s',
                     datefmt='%y-%m-%d %H:%M:%S')
@@ -105,7 +143,7 @@ USAGE
         
         if args.report:
             logger.info('report dir %s' % args.report)
-            Report(args.report, args.process_names)
+            Report(args.report, args.process_names, args.top, args.jobs, args.cache, args.export, args.chart_points)
             return 0
         
         if args.monkey is not None:
@@ -121,41 +159,15 @@ USAGE
                 
         config = Config(args)
         total_time = args.time * 60 if args.time > 0 else None
-        timeout = len(config.commands) * 10
-        def watchdog():
-            logger.error('watchdog %s seconds timeout' % timeout)
-            for command in config.commands:
-                command.kill()
+        collector = Collector(config, total_time, args.batch)
         logger.info('start collection')
-        try:
-            while total_time is None or total_time > 0:
-                timer = Timer(timeout, watchdog)
-                timer.setDaemon(True)
-                timer.start()
-                logger.debug('watchdog start')
-                before = time()
-                for command in config.commands:
-                    command.execute()
-                if timer.isAlive():
-                    timer.cancel()
-                    logger.debug('watchdog cancel')
-                timer.join()
-                if total_time is not None:
-                    total_time -= args.interval
-                    logger.debug("remain time: %s sec." % total_time)
-                delta = time() - before
-                if delta < args.interval:
-                    sleep(args.interval - delta)
-        except KeyboardInterrupt:
-            logger.info('KeyboardInterrupt')
-        for command in config.commands:
-            command.clean()
+        collector.run()
+        collector.clean()
         if config.last_commads:
             logger.info('please wait a moment')
-        for command in config.last_commads:
-            command.execute()
+        collector.finish()
         logger.info('collection finish')
-        Report(config.log_dir, args.process_names)
+        Report(config.log_dir, args.process_names, args.top, args.jobs, args.cache, args.export, args.chart_points)
         logger.info('finish')
     except KeyboardInterrupt:
         return 0
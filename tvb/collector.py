@@ -0,0 +1,177 @@
+# encoding: utf-8
+'''
+@author:     Juncheng Chen
+
+@copyright:  1999-2015 Alibaba.com. All rights reserved.
+
+@license:    Apache Software License 2.0
+
+@contact:    juncheng.cjc@outlook.com
+'''
+import os
+from datetime import datetime
+from threading import Thread, Timer, Event
+from time import time
+
+from tvb.command import BatchLoopCommand
+from tvb.device import Latency
+from tvb.scheduler import Scheduler
+from tvb.sink import MetricSink
+
+import logging
+logger = logging.getLogger(__name__)
+
+class DeviceWorker(Thread):
+    '''Run the command set of one device, each command on its own cadence.'''
+    def __init__(self, device, commands, stop_event, deadline=None, batch=False, sink=None):
+        Thread.__init__(self, name=device.device)
+        self.setDaemon(True)
+        self.device = device
+        self.commands = commands
+        self.stop_event = stop_event
+        self.deadline = deadline
+        self.batch = batch
+        self.sink = sink
+        self.log = None
+        self.ticks = 0
+        self.overruns = 0
+        self.max_delta = 0
+
+    def is_expired(self):
+        return self.stop_event.is_set() or (self.deadline is not None and time() >= self.deadline)
+
+    def fuse(self, commands):
+        batch = [command for command in commands if command.batchable]
+        if not self.batch or len(batch) < 2:
+            return commands
+        return [BatchLoopCommand(batch)] + [command for command in commands if not command.batchable]
+
+    def execute(self, command):
+        '''run command under its own deadline, return (status, latency)'''
+        expired = []
+        def watchdog():
+            expired.append(True)
+            logger.error('%s %s timeout after %s seconds' % (self.device.device, command.name, command.max_runtime))
+            command.kill()
+        timer = Timer(command.max_runtime, watchdog)
+        timer.setDaemon(True)
+        self.device.latency = latency = Latency()
+        status = 'ok'
+        timer.start()
+        try:
+            command.execute()
+        except Exception, e:
+            status = 'error'
+            logger.error('%s %s failed: %s' % (self.device.device, command.name, e))
+        finally:
+            timer.cancel()
+        if expired:
+            status = 'timeout'
+        return status, latency
+
+    def tick(self, commands):
+        timestamp = datetime.now().strftime('%m/%d %H:%M:%S')
+        records = []
+        for command in self.fuse(commands):
+            if self.stop_event.is_set():
+                break
+            if not self.device.is_online():
+                # skipped instead of waiting for adb, the reconnect runs in the background
+                command.gap(timestamp)
+                records.append('%s status=%s' % (command.name, self.device.state))
+                continue
+            status, latency = self.execute(command)
+            records.append('%s %s status=%s' % (command.name, latency, status))
+        if self.log is None:
+            self.log = self.device.open_log('latency.txt')
+        self.log.write(">>%s>>\n%s\n" % (timestamp, '\n'.join(records)))
+        if self.sink:
+            self.sink.handle(timestamp, '\n'.join(records))
+
+    def run(self):
+        scheduler = Scheduler(self.commands)
+        while not self.is_expired():
+            now = time()
+            delay = scheduler.next_due() - now
+            if delay > 0:
+                if self.deadline is not None:
+                    delay = min(delay, self.deadline - now)
+                self.stop_event.wait(delay)
+                continue
+            entries = scheduler.pop_due(now)
+            self.tick([command for base, command in entries])
+            self.ticks += 1
+            after = time()
+            self.max_delta = max(self.max_delta, after - now)
+            for base, command in entries:
+                late = scheduler.reschedule(base, command, after)
+                if late:
+                    self.overruns += 1
+                    logger.warning('%s %s overrun, %.1f seconds behind its %s seconds period' % (self.device.device, command.name, late, command.period))
+        if self.log:
+            self.log.close()
+        if self.sink:
+            self.sink.close()
+
+    def summary(self):
+        return '%s %d ticks, %d overruns, slowest tick %.1f seconds' % (self.device.device, self.ticks, self.overruns, self.max_delta)
+
+class Collector(object):
+    def __init__(self, config, total_time=None, batch=False):
+        self.config = config
+        self.total_time = total_time
+        self.batch = batch
+        self.stop_event = Event()
+
+    def group_by_device(self, commands):
+        groups = []
+        for device in self.config.devices:
+            device_commands = [command for command in commands if command.device is device]
+            if device_commands:
+                groups.append((device, device_commands))
+        return groups
+
+    def get_sink(self, device):
+        args = self.config.args
+        if args.sink:
+            return MetricSink(device.log_dir, 'latency', args.sink, args.process_names, device.core_num, args.top)
+        
+    def wait(self, threads):
+        # join with timeout so that KeyboardInterrupt still reaches the main thread
+        while [thread for thread in threads if thread.isAlive()]:
+            for thread in threads:
+                thread.join(1)
+
+    def run(self):
+        deadline = time() + self.total_time if self.total_time is not None else None
+        workers = [DeviceWorker(device, commands, self.stop_event, deadline, self.batch, self.get_sink(device)) for device, commands in self.group_by_device(self.config.commands)]
+        for worker in workers:
+            worker.start()
+        try:
+            self.wait(workers)
+        except KeyboardInterrupt:
+            logger.info('KeyboardInterrupt')
+            self.stop_event.set()
+            self.wait(workers)
+        for worker in workers:
+            logger.info(worker.summary())
+
+    def clean(self):
+        for command in self.config.commands:
+            command.clean()
+
+    def finish(self):
+        def execute(commands):
+            for command in commands:
+                command.execute()
+        threads = []
+        for device, commands in self.group_by_device(self.config.last_commads):
+            thread = Thread(target=execute, args=(commands,), name=device.device)
+            thread.setDaemon(True)
+            thread.start()
+            threads.append(thread)
+        self.wait(threads)
+        for command in self.config.commands:
+            command.close()
+        for device in self.config.devices:
+            device.close()
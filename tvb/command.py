@@ -10,22 +10,53 @@
 '''
 import os
 from datetime import datetime
+from threading import Thread, Lock
+from time import time
 import copy
 
+from tvb.storage import read_chunks
+from tvb.logstats import LogStats
+from tvb.hprof import summarize, dispose
+
 import logging
 logger = logging.getLogger(__name__)
 
 class Command(object):
-    def __init__(self, name, command=None, clean_command=None):
+    batchable = False
+    
+    def __init__(self, name, command=None, clean_command=None, period=None, jitter=0, max_runtime=10):
         self.name = name
         self.command = command
         self.clean_command = clean_command
         self.process = None
+        self.period = period
+        self.jitter = jitter
+        self.max_runtime = max_runtime
         
     def new(self, device, args):
-        self.device = device
-        self.args = args
-        return copy.deepcopy(self)
+        command = copy.deepcopy(self)
+        # share the device between commands, workers are grouped by it
+        command.device = device
+        command.args = args
+        if command.period is None:
+            command.period = args.interval
+        return command
+    
+    def set_schedule(self, period=None, jitter=None, max_runtime=None):
+        if period is not None:
+            self.period = period
+        if jitter is not None:
+            self.jitter = jitter
+        if max_runtime is not None:
+            self.max_runtime = max_runtime
+            
+    def get_delay(self):
+        '''seconds from the last scheduled run to the next one'''
+        return self.period
+    
+    def get_first_delay(self):
+        '''seconds from the start to the first run'''
+        return 0
     
     def kill(self):
         if self.process:
@@ -45,35 +76,197 @@ class Command(object):
     def clean(self):
         pass
     
+    def gap(self, timestamp):
+        '''the device was offline when the command was due'''
+        pass
+    
+    def close(self):
+        pass
+    
 class LastCommand(Command):
     def execute(self):
         if self.command:
             logger.debug('execute single command %s' % self.command)
-            with open(os.path.join(self.device.log_dir, '%s.txt' % self.name), 'a') as f:
+            log = self.device.open_log('%s.txt' % self.name)
+            try:
                 self.process = self.device.shell(self.command)
-                f.write(self.device.get_process_stdout(self.process))
+                log.write(self.device.get_process_stdout(self.process))
+            finally:
+                log.close()
                 
 class LoopCommand(Command):
+    batchable = True
+    # MetricSink fed with every sample, set by Config with --sink
+    sink = None
+    writer = None
+    
     def execute(self):
         if self.command:
             logger.debug('execute loop command %s' % self.command)
-            with open(os.path.join(self.device.log_dir, '%s.txt' % self.name), 'a') as f:
-                self.process = self.device.shell(self.command)
-                f.write(">>%s>>\n%s\n" % (datetime.now().strftime('%m/%d %H:%M:%S'), self.device.get_process_stdout(self.process)))
+            self.handle(datetime.now().strftime('%m/%d %H:%M:%S'), self.device.run(self.command))
             
-class AnrLoopCommand(LoopCommand):
+    def handle(self, timestamp, output):
+        if self.writer is None:
+            self.writer = self.device.open_log('%s.txt' % self.name)
+        self.writer.write(">>%s>>\n%s\n" % (timestamp, output))
+        if self.sink:
+            self.sink.handle(timestamp, output)
+            
+    def gap(self, timestamp):
+        # an empty sample is a row without values, charts show the outage
+        if self.command:
+            self.handle(timestamp, '')
+                
+    def kill(self):
+        Command.kill(self)
+        self.device.kill_session()
+        
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        if self.sink:
+            self.sink.close()
+            self.sink = None
+
+class BatchLoopCommand(LoopCommand):
+    '''Fuse the loop commands of one device into a single shell round trip.'''
+    def __init__(self, commands):
+        LoopCommand.__init__(self, 'batch', max_runtime=sum(command.max_runtime for command in commands))
+        self.commands = commands
+        self.device = commands[0].device
+        
+    def execute(self):
+        commands = [command for command in self.commands if command.command]
+        if commands:
+            logger.debug('execute batch command %s' % ', '.join(command.name for command in commands))
+            timestamp = datetime.now().strftime('%m/%d %H:%M:%S')
+            for command, output in zip(commands, self.device.run_batch([command.command for command in commands])):
+                command.handle(timestamp, output)
+                
+    def clean(self):
+        for command in self.commands:
+            command.clean()
+            
+    def gap(self, timestamp):
+        for command in self.commands:
+            command.gap(timestamp)
+
+ANR_REMOTE = '/sdcard/tvb_anr.gz'
+# newest traces file, gzipped on the device when it has a gzip, prints "gz|raw <traces path>"
+ANR_CAPTURE = 'f=$(ls -t /data/anr/* 2>/dev/null | head -n 1); [ -n "$f" ] || exit 0; ' \
+              'for z in gzip "busybox gzip"; do $z -c $f > %s 2>/dev/null && echo "gz $f" && exit 0; done; echo "raw $f"' % ANR_REMOTE
+# the traces are dumped after the am_anr event is logged
+ANR_SETTLE = 5
+
+class AnrCommand(Command):
+    '''Capture the ANR traces when the events log reports am_anr.
+
+    A logcat filtered to am_anr runs for the whole collection, so a tick
+    without an ANR costs no adb call, and the traces are only transferred
+    after an ANR, gzipped on the device.
+    '''
+    def new(self, device, args):
+        command = Command.new(self, device, args)
+        command.pending = None
+        command.events = None
+        command.lock = Lock()
+        return command
+    
     def execute(self):
-        logger.debug('execute loop command %s' % self.command)
-        if not hasattr(self, 'timestamp'):
-            self.process = self.device.shell(self.command)
-            self.timestamp = self.device.get_process_stdout(self.process)
-        self.process = self.device.shell(self.command)
-        timestamp = self.device.get_process_stdout(self.process)
-        if timestamp != self.timestamp:
-            self.timestamp = timestamp
-            with open(os.path.join(self.device.log_dir, '%s_%s.txt' % (self.name, datetime.now().strftime('%Y%m%d%H%M%S'))), 'w') as f:
-                self.process = self.device.shell('cat /data/anr/traces.txt')
-                f.write(self.device.get_process_stdout(self.process))
+        if self.is_done():
+            self.watch()
+        with self.lock:
+            due = self.pending is not None and time() - self.pending >= ANR_SETTLE
+            if due:
+                self.pending = None
+        if due:
+            self.capture()
+            
+    def watch(self):
+        # logcat starts with the events still in its buffer, they were logged before this watch
+        replayed = len([line for line in self.device.run('%s -d' % self.command).splitlines() if 'am_anr' in line])
+        logger.debug('execute anr watcher %s' % self.command)
+        self.process = self.device.popen(self.command)
+        if self.process.stdout is not None:
+            thread = Thread(target=self.read, args=(self.process.stdout, replayed), name='%s anr' % self.device.device)
+            thread.setDaemon(True)
+            thread.start()
+        
+    def read(self, stream, replayed=0):
+        for line in iter(stream.readline, ''):
+            line = line.rstrip('\r\n')
+            # 10-18 18:34:46.123  1000  1234  1250 I am_anr  : [0,4321,com.example.app,...]
+            if 'am_anr' not in line:
+                continue
+            if replayed:
+                replayed -= 1
+                continue
+            logger.info('%s %s' % (self.device.device, line))
+            with self.lock:
+                if self.pending is None:
+                    self.pending = time()
+                if self.events is None:
+                    self.events = self.device.open_log('%s_events.txt' % self.name)
+                self.events.write('%s\n' % line)
+                
+    def capture(self):
+        output = self.device.run(ANR_CAPTURE).split()
+        if len(output) != 2:
+            logger.error('%s no ANR traces found' % self.device.device)
+            return
+        kind, path = output
+        local = os.path.join(self.device.log_dir, '.anr.txt.gz' if kind == 'gz' else '.anr.txt')
+        self.device.pull(ANR_REMOTE if kind == 'gz' else path, local)
+        if kind == 'gz':
+            self.device.run('rm -f %s' % ANR_REMOTE)
+        if not os.path.exists(local):
+            logger.error('%s pull ANR traces %s failed' % (self.device.device, path))
+            return
+        log = self.device.open_log('%s_%s.txt' % (self.name, datetime.now().strftime('%Y%m%d%H%M%S')))
+        try:
+            for chunk in read_chunks(local):
+                log.write(chunk, flush=False)
+        finally:
+            log.close()
+            os.remove(local)
+        
+    def clean(self):
+        Command.kill(self)
+        
+    def close(self):
+        with self.lock:
+            if self.events:
+                self.events.close()
+                self.events = None
+    
+class LogStatsLoopCommand(LoopCommand):
+    '''Summarize the performance events of the logcat logs on the host, the logs are read as they grow.'''
+    batchable = False
+    
+    def new(self, device, args):
+        command = LoopCommand.new(self, device, args)
+        command.stats = LogStats(device.log_dir)
+        return command
+    
+    def execute(self):
+        self.handle(datetime.now().strftime('%m/%d %H:%M:%S'), self.stats.collect())
+        
+    def kill(self):
+        # nothing runs on the device
+        pass
+    
+GFXINFO_MARK = 'TVB_GFX'
+
+class GfxinfoLoopCommand(LoopCommand):
+    '''Frame timings of the -p processes from gfxinfo framestats, reset after every read so that no frame is logged twice.'''
+    def new(self, device, args):
+        if args.process_names:
+            self.command = '; '.join("echo %s %s; dumpsys gfxinfo %s framestats | grep -E '^(Flags|[0-9]+),'; dumpsys gfxinfo %s reset >/dev/null"
+                                     % (GFXINFO_MARK, process_name, process_name, process_name) for process_name in args.process_names)
+        else:
+            self.command = None
+        return LoopCommand.new(self, device, args)
     
 class MemdetailLoopCommand(LoopCommand):
     def new(self, device, args):
@@ -91,35 +284,119 @@ class ShowMapLoopCommand(LoopCommand):
             self.command = None
         return LoopCommand.new(self, device, args)
     
+SYSFS_NODES = ['/sys/class/thermal/thermal_zone*/type', '/sys/class/thermal/thermal_zone*/temp',
+               '/sys/class/devfreq/*/cur_freq', '/sys/class/devfreq/*/min_freq', '/sys/class/devfreq/*/max_freq']
+CPUFREQ_NODES = ['/sys/devices/system/cpu/cpufreq/policy*/scaling_*_freq', '/sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_*_freq']
+
+class SysfsLoopCommand(LoopCommand):
+    '''Read every thermal zone, cpufreq policy and devfreq node found at startup with a single grep.'''
+    def new(self, device, args):
+        command = LoopCommand.new(self, device, args)
+        command.command = command.discover()
+        return command
+    
+    def discover(self):
+        # per cpu nodes only on kernels without cpufreq policies
+        nodes = self.device.run('ls -d %s 2>/dev/null; ls -d %s 2>/dev/null || ls -d %s 2>/dev/null' % (' '.join(SYSFS_NODES), CPUFREQ_NODES[0], CPUFREQ_NODES[1])).split()
+        nodes = [node for node in nodes if node.startswith('/sys/')]
+        logger.info('%s sysfs nodes: %d' % (self.device.device, len(nodes)))
+        if nodes:
+            # -H keeps the path prefix when a single node was found
+            return "grep -H '' %s 2>/dev/null" % ' '.join(nodes)
+    
+# classes of a heap dump kept in its summary, from the largest shallow size
+HPROF_CLASSES = 1000
+
 class DumpheapLoopCommand(LoopCommand):
+    '''Dump the heap of the first -p process, every pulled hprof is summarized to a class histogram sample of dumpheap.txt.'''
+    batchable = False
+    
     def new(self, device, args):
-        self.delay = 3600 / args.interval
         self.hprof = '/sdcard/dumpheap.hprof'
         self.clean_command = 'rm -f %s' % self.hprof
         if args.process_names:
             self.command = "am dumpheap %s %s" % (args.process_names[0], self.hprof)
         else:
             self.command = None
-        self.i = 0
-        return LoopCommand.new(self, device, args)
+        self.dumping = False
+        command = LoopCommand.new(self, device, args)
+        # summarizing a large dump takes a while, it runs beside the collection
+        command.summarizer = None
+        # (timestamp, histogram) of the summarizer, logged by the worker thread
+        command.summary = None
+        return command
+    
+    def get_delay(self):
+        # give the device two intervals to write the dump before pulling it
+        pull_delay = self.args.interval * 2
+        if self.dumping:
+            return pull_delay
+        return max(self.period - pull_delay, pull_delay)
+    
+    def get_first_delay(self):
+        # the first dump is pulled one period after the start, not at the start
+        return self.get_delay()
+    
+    def gap(self, timestamp):
+        pass
     
     def execute(self):
+        if self.summarizer and not self.summarizer.isAlive():
+            self.join()
         if self.command:
-            if self.i == (self.delay - 2):
+            if not self.dumping:
                 logger.debug('execute loop command %s' % self.command)
                 self.clean()
-                self.device.get_process_stdout(self.device.shell(self.command))
-            elif self.i == self.delay:
-                self.i = 0
-                self.device.adb('pull %s %s' % (self.hprof, os.path.join(self.device.log_dir, '%s_%s.hprof' % (self.name, datetime.now().strftime('%Y%m%d_%H%M%S')))))
-            self.i += 1
+                self.process = self.device.shell(self.command)
+                self.device.get_process_stdout(self.process)
+                self.process = None
+                self.dumping = True
+            else:
+                self.dumping = False
+                timestamp = datetime.now()
+                local = os.path.join(self.device.log_dir, '%s_%s.hprof' % (self.name, timestamp.strftime('%Y%m%d_%H%M%S')))
+                self.device.pull(self.hprof, local)
+                if os.path.exists(local):
+                    self.join()
+                    self.summarizer = Thread(target=self.summarize, args=(timestamp.strftime('%m/%d %H:%M:%S'), local), name='%s hprof' % self.device.device)
+                    self.summarizer.setDaemon(True)
+                    self.summarizer.start()
+                    
+    def summarize(self, timestamp, path):
+        try:
+            self.summary = (timestamp, summarize(path, HPROF_CLASSES))
+            dispose(path, self.args.hprof)
+        except Exception, e:
+            logger.error('summarize %s failed: %s' % (path, e))
+            
+    def join(self):
+        '''wait for the summarizer and log its summary'''
+        if self.summarizer:
+            self.summarizer.join()
+            self.summarizer = None
+        if self.summary:
+            self.handle(*self.summary)
+            self.summary = None
             
     def clean(self):
         if self.clean_command:
             logger.debug('execute loop clean command %s' % self.clean_command)
             self.device.get_process_stdout(self.device.shell(self.clean_command))
             
+    def kill(self):
+        # neither the dump nor the pull runs in the shell session
+        Command.kill(self)
+        self.device.cancel_transfer()
+        
+    def close(self):
+        self.join()
+        LoopCommand.close(self)
             
+# kill the processes started with exactly this command line, killall logcat would also end the anr watcher,
+# toolbox before Android M has no tr, prints the number of processes killed
+KILL_COMMAND_LINE = "t=tr; echo | tr a a >/dev/null 2>&1 || t='busybox tr'; n=0; " \
+                    "for p in /proc/[0-9]*; do [ \"$($t '\\0' ' ' < $p/cmdline 2>/dev/null)\" = '%s ' ] && kill ${p#/proc/} && n=$((n+1)); done; echo killed $n"
+
 class DurableCommand(Command):
     
     def execute(self):
@@ -131,7 +408,8 @@ class DurableCommand(Command):
     def clean(self):
         if self.clean_command:
             logger.debug('execute durable clean command %s' % self.command)
-            self.device.get_process_stdout(self.device.shell(self.clean_command))
+            if self.device.run(self.clean_command) == 'killed 0':
+                logger.info('%s no %s was running' % (self.device.device, self.command))
             if self.process:
                 self.process.wait()
 
@@ -192,22 +470,27 @@ class ScriptMonkeyDurableCommand(MonkeyDurableCommand):
             
 COMMAND_CONFIG = {
     'top': LoopCommand('top', 'top -n 1'),
-    'meminfo': LoopCommand('meminfo', 'dumpsys meminfo'),
+    'meminfo': LoopCommand('meminfo', 'dumpsys meminfo', max_runtime=30),
     'cpuinfo': LoopCommand('cpuinfo', 'dumpsys cpuinfo'),
     'mali': LoopCommand('mali', 'librank -P /dev/mali'),
     'activity': LoopCommand('activity', 'dumpsys activity'),
     'oom': LoopCommand('activity_oom', 'dumpsys activity oom'),
     'processes': LoopCommand('activity_processes', 'dumpsys activity processes'),
     'procstats': LoopCommand('activity_procstats', 'dumpsys activity procstats'),
+    'procfs': LoopCommand('procfs', "cat /proc/stat /proc/meminfo /proc/[0-9]*/stat 2>/dev/null; grep '' /proc/[0-9]*/statm 2>/dev/null"),
+    'sysfs': SysfsLoopCommand('sysfs', max_runtime=20),
     'temp0': LoopCommand('temperature_zone0', 'cat /sys/class/thermal/thermal_zone0/temp'),
     'temp1': LoopCommand('temperature_zone1', 'cat /sys/class/thermal/thermal_zone1/temp'),
-    'anr': AnrLoopCommand('anr', 'ls -l /data/anr/traces.txt'),
-    'memdetail': MemdetailLoopCommand('memdetail'),
+    'anr': AnrCommand('anr', 'logcat -v threadtime -b events -s am_anr', max_runtime=60),
+    'memdetail': MemdetailLoopCommand('memdetail', max_runtime=30),
     'showmap': ShowMapLoopCommand('showmap'),
-    'dumpheap': DumpheapLoopCommand('dumpheap'),
+    'gfxinfo': GfxinfoLoopCommand('gfxinfo'),
+    # writing and pulling the dump of a large heap takes minutes
+    'dumpheap': DumpheapLoopCommand('dumpheap', period=3600, max_runtime=600),
     
-    'logcat': DurableCommand('logcat', 'logcat -v threadtime', 'busybox killall logcat'),
-    'event': DurableCommand('logcat_event', 'logcat -v threadtime -b events'),
+    'logcat': DurableCommand('logcat', 'logcat -v threadtime', KILL_COMMAND_LINE % 'logcat -v threadtime'),
+    'event': DurableCommand('logcat_event', 'logcat -v threadtime -b events', KILL_COMMAND_LINE % 'logcat -v threadtime -b events'),
+    'logstats': LogStatsLoopCommand('logstats'),
     
     'monkey': AppMonkeyDurableCommand('monkey'),
     'blacklist': BlacklistMonkeyDurableCommand('monkey'),
@@ -10,31 +10,81 @@
 '''
 import os
 from datetime import datetime
+from threading import Thread
 
 import logging
 logger = logging.getLogger(__name__)
 
 from tvb.device import Device
-from tvb.command import COMMAND_CONFIG, LAST_COMMAND_CONFIG
+from tvb.command import COMMAND_CONFIG, LAST_COMMAND_CONFIG, LoopCommand
+from tvb.info import INFO_CONFIG
+from tvb.sink import MetricSink
+from tvb.storage import check_compress, Rotation
+from tvb.agent import AgentCommand
+from tvb.adbclient import get_client
+from tvb.metadata import DeviceMetadata
 
 class Config(object):
     def __init__(self, args):
+        self.args = args
         self.log_dir = os.path.join(args.log_dir, datetime.now().strftime('%Y.%m.%d-%H.%M.%S'))
         if not os.path.isdir(self.log_dir):
             logger.info('create log dir %s' % self.log_dir)
             os.makedirs(self.log_dir)
         self.devices, self.commands, self.last_commads = [], [], []
-        for device in args.devices:
-            self.devices.append(Device(device, self.log_dir))
+        check_compress(args.compress)
+        rotation = self.get_rotation(args)
+        self.devices = self.create_devices(args.devices, rotation, get_client(args.adb), DeviceMetadata(refresh=args.refresh_devices))
         for device in self.devices:
             for name in args.commands:
                 if name in COMMAND_CONFIG:
                     command = COMMAND_CONFIG.get(name).new(device, args)
+                    if args.schedule and name in args.schedule:
+                        command.set_schedule(*args.schedule[name])
+                    if args.sink and isinstance(command, LoopCommand) and command.name in INFO_CONFIG:
+                        command.sink = MetricSink(device.log_dir, command.name, args.sink, args.process_names, device.core_num, args.top)
                     self.commands.append(command)
                     logger.debug('%s add %s %s' % (device.device, command.__class__.__name__, command.command))
                 elif name in LAST_COMMAND_CONFIG:
                     command = LAST_COMMAND_CONFIG.get(name).new(device, args)
                     self.last_commads.append(command)
                     logger.debug('%s add %s %s' % (device.device, command.__class__.__name__, command.command))
+        if args.agent:
+            self.use_agent(args.pull_interval)
                     
-    
\ No newline at end of file
+    def create_devices(self, names, rotation, client, metadata):
+        '''connect and probe all devices at the same time, in the order of names'''
+        devices, errors = [None] * len(names), [None] * len(names)
+        def create(index, name):
+            try:
+                devices[index] = Device(name, self.log_dir, self.args.compress, rotation, client, metadata)
+            except Exception, e:
+                logger.error('%s init failed: %s' % (name, e))
+                errors[index] = e
+        threads = [Thread(target=create, args=(index, name), name=name) for index, name in enumerate(names)]
+        for thread in threads:
+            thread.setDaemon(True)
+            thread.start()
+        for thread in threads:
+            thread.join()
+        metadata.save()
+        for error in errors:
+            if error is not None:
+                raise error
+        return devices
+                    
+    def use_agent(self, pull_interval):
+        '''replace the loop commands of every device with an agent sampling them on the device'''
+        for device in self.devices:
+            commands = [command for command in self.commands if command.device is device and command.batchable and command.command]
+            if commands:
+                self.commands = [command for command in self.commands if command not in commands]
+                self.commands.append(AgentCommand(commands, pull_interval))
+                logger.debug('%s agent samples %s' % (device.device, ', '.join(command.name for command in commands)))
+                    
+    def get_rotation(self, args):
+        limits = [args.rotate_size, args.rotate_time, args.retention_size, args.retention_time]
+        if all(limit is None for limit in limits):
+            return None
+        scales = [1024 * 1024, 60, 1024 * 1024 * 1024, 3600]
+        return Rotation(*[limit * scale if limit is not None else None for limit, scale in zip(limits, scales)])
@@ -9,65 +9,338 @@
 @contact:    juncheng.cjc@outlook.com
 '''
 import os
+import socket
 import subprocess
+from threading import Thread, Timer, Lock, Event
+
+from tvb.storage import LogWriter, LogPump
+from tvb.adbclient import AdbError, AdbProcess
 
 import logging
-from time import sleep
+from time import sleep, time
 logger = logging.getLogger(__name__)
 
+PUMP_TIMEOUT = 5
+HEALTHY, DEGRADED, OFFLINE = 'healthy', 'degraded', 'offline'
+# exit code of adb when it could not reach the device
+ADB_FAILURE = 255
+# seconds a device has to answer the probe of the reconnect
+PROBE_TIMEOUT = 10
+# seconds between two reconnect attempts, doubled after every failed one
+BACKOFF_MIN = 1
+BACKOFF_MAX = 60
+
+class Latency(object):
+    '''Cost of the adb calls made on behalf of one command execution.'''
+    def __init__(self):
+        self.spawn = 0.0
+        self.run = 0.0
+        self.bytes = 0
+        
+    def __str__(self):
+        return 'spawn=%.3f run=%.3f bytes=%d' % (self.spawn, self.run, self.bytes)
+
+class ShellSession(object):
+    '''Long-lived adb shell, commands are fed over stdin and responses are split by sentinels.'''
+    def __init__(self, address, client=None):
+        self.address = address
+        self.client = client
+        self.process = None
+        self.count = 0
+        self.lock = Lock()
+        # the running command was killed by cancel, the session itself did not fail
+        self.cancelled = False
+        
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+    
+    def spawn(self):
+        logger.debug('spawn shell session for %s' % self.address)
+        if self.client:
+            self.process = self.client.shell(self.address)
+        else:
+            self.process = subprocess.Popen(['adb', '-s', self.address, 'shell'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        
+    def kill(self):
+        process = self.process
+        if process and process.poll() is None:
+            logger.debug('kill shell session for %s' % self.address)
+            process.kill()
+            process.wait()
+            
+    def cancel(self):
+        self.cancelled = True
+        self.kill()
+            
+    def close(self):
+        with self.lock:
+            if self.is_alive():
+                try:
+                    self.process.stdin.write('exit\n')
+                    self.process.stdin.close()
+                except IOError:
+                    pass
+            self.kill()
+            self.process = None
+        
+    def execute(self, cmd):
+        '''return (output, exit code), exit code is None when the session died'''
+        with self.lock:
+            self.cancelled = False
+            if not self.is_alive():
+                self.spawn()
+                if not self.is_alive():
+                    return '', None
+            self.count += 1
+            begin, end = 'TVB_BEGIN_%d' % self.count, 'TVB_END_%d' % self.count
+            # the empty quotes keep the echoed input line from matching the sentinels
+            line = 'echo %s""%s; (%s) </dev/null; echo %s""%s $?\n' % (begin[:4], begin[4:], cmd, end[:4], end[4:])
+            try:
+                self.process.stdin.write(line)
+                self.process.stdin.flush()
+            except IOError:
+                self.kill()
+                return '', None
+            lines, started = [], False
+            for line in iter(self.process.stdout.readline, ''):
+                line = line.rstrip('\r\n')
+                if not started:
+                    started = line == begin
+                    continue
+                # output without a trailing newline runs into the end sentinel
+                index = line.find(end)
+                if index < 0:
+                    lines.append(line)
+                    continue
+                lines.append(line[:index])
+                ret = line[index + len(end):].strip()
+                return '\n'.join(lines).strip(), int(ret) if ret.isdigit() else 0
+            self.kill()
+            return '\n'.join(lines).strip(), None
+
 class Device(object):
-    def __init__(self, device, log_dir):
+    def __init__(self, device, log_dir, compress=None, rotation=None, client=None, metadata=None):
         self.log_dir = os.path.join(log_dir, device)
         if not os.path.isdir(self.log_dir):
             logger.info('create device dir %s' % self.log_dir)
             os.makedirs(self.log_dir)
         self.device = device
         self.address = None
+        self.session = None
+        # pull in progress, killed by cancel_transfer
+        self.transfer = None
+        self.latency = Latency()
+        self.compress = compress
+        self.rotation = rotation
+        # AdbClient talking to the adb server directly, None runs the adb binary
+        self.client = client
+        # (process, pump) of durable commands streamed through a LogWriter
+        self.pumps = []
+        # transport health, see fail
+        self.state = HEALTHY
+        self.health_lock = Lock()
+        self.recovering = None
+        self.closed = Event()
         self.connect()
+        self.metadata = metadata.get(device) if metadata else None
+        # an ip address may be taken by another device, the cached facts are only kept for the same serial
+        if self.metadata and self.metadata.get('serial') != (self.run('getprop ro.serialno') or None):
+            logger.info('%s is another device than the cached one' % device)
+            self.metadata = None
+        if self.metadata is None:
+            self.metadata = self.probe()
+            if metadata and self.metadata['core_num']:
+                metadata.set(device, self.metadata)
+        else:
+            logger.info('%s metadata from cache' % device)
+        logger.info('%s model %s, Android %s, RAM %s kB' % (device, self.metadata['model'], self.metadata['android'], self.metadata['ram']))
+        self.core_num = self.metadata['core_num'] or 1
+        if self.metadata['core_num']:
+            logger.info('%s CPU core number is %s' % (device, self.core_num))
+        else:
+            logger.error('%s get CPU core number failed, set core number to 1' % device)
         with open(os.path.join(self.log_dir, 'corenum.txt'), 'w') as f:
-            core_num = self.get_core_number()
-            f.write(core_num)
+            f.write(str(self.core_num))
             
-    def get_core_number(self):
+    def probe(self):
+        '''static facts of the device, all read in one round trip'''
+        cpus, serial, model, android, meminfo = self.run_batch(['ls /sys/devices/system/cpu/', 'getprop ro.serialno', 'getprop ro.product.model',
+                                                                'getprop ro.build.version.release', 'grep MemTotal /proc/meminfo'])
+        # MemTotal:        2048000 kB
+        ram = meminfo.split()[1:2]
+        return {'core_num': self.get_core_number(cpus.splitlines()), 'serial': serial or None, 'model': model or None, 'android': android or None,
+                'ram': int(ram[0]) if ram and ram[0].isdigit() else None}
+            
+    def get_core_number(self, lines):
         core_num = 0
-        lines = self.get_process_stdout(self.shell('ls /sys/devices/system/cpu/')).splitlines()
         for line in lines:
             if line.startswith('cpu') and line[-1].isdigit():
                 core_num += 1
-        if core_num == 0:
-            logger.error('get CPU core number failed, set core number to 1')
-            core_num = 1
-        else:
-            logger.info('CPU core number is %s' % core_num)
-        return str(core_num)
+        return core_num
         
+    def open_log(self, file_name):
+        '''LogWriter appending to file_name in the device log dir, compressed as configured'''
+        return LogWriter(os.path.join(self.log_dir, file_name), self.compress, self.rotation)
+    
     def execmd(self, cmd):
         return subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE).stdout.read().replace('\r\r', '').strip()
     
     def adb(self, cmd):
         cmd = 'adb -s %s %s' % (self.address, cmd)
         logger.debug(cmd)
-        return subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE).stdout.read().replace('\r\r', '').strip()
+        before = time()
+        result = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE).stdout.read().replace('\r\r', '').strip()
+        self.latency.run += time() - before
+        self.latency.bytes += len(result)
+        return result
     
-    def shell(self, cmd, redirect=None):
+    def pull(self, remote, local):
+        '''copy remote to local, cancel_transfer aborts the copy from another thread'''
+        before = time()
+        try:
+            if self.client:
+                self.client.pull(self.address, remote, local, self.set_transfer)
+            else:
+                cmd = ['adb', '-s', self.address, 'pull', remote, local]
+                logger.debug(' '.join(cmd))
+                self.transfer = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                self.transfer.communicate()
+                if self.transfer.returncode != 0 and os.path.exists(local):
+                    os.remove(local)
+        finally:
+            self.transfer = None
+        self.latency.run += time() - before
+        if os.path.exists(local):
+            self.latency.bytes += os.path.getsize(local)
+        
+    def set_transfer(self, sock):
+        self.transfer = AdbProcess(sock)
+        
+    def cancel_transfer(self):
+        transfer = self.transfer
+        if transfer and transfer.poll() is None:
+            logger.debug('cancel transfer of %s' % self.address)
+            transfer.kill()
+        
+    def push(self, local, remote):
+        if self.client:
+            before = time()
+            self.client.push(self.address, local, remote)
+            self.latency.run += time() - before
+            return
+        self.adb('push %s %s' % (local, remote))
+    
+    def popen(self, cmd):
+        if self.client:
+            logger.debug('adb -s %s shell %s' % (self.address, cmd))
+            return self.client.shell(self.address, cmd)
         cmd = 'adb -s %s shell "%s"' % (self.address, cmd)
         logger.debug(cmd)
-        if redirect:
-            with open(redirect, 'a') as f:
-                return subprocess.Popen(cmd, shell=True, stdout=f)
         return subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
     
+    def shell(self, cmd, redirect=None):
+        before = time()
+        try:
+            if redirect and (self.compress or self.rotation or self.client):
+                process = self.popen(cmd)
+                if process.stdout is not None:
+                    pump = LogPump(process.stdout, LogWriter(redirect, self.compress, self.rotation))
+                    pump.start()
+                    self.pumps.append((process, pump))
+                return process
+            if redirect:
+                cmd = 'adb -s %s shell "%s"' % (self.address, cmd)
+                logger.debug(cmd)
+                with open(redirect, 'a') as f:
+                    return subprocess.Popen(cmd, shell=True, stdout=f)
+            return self.popen(cmd)
+        finally:
+            self.latency.spawn += time() - before
+    
+    def run(self, cmd):
+        '''execute cmd in the persistent shell session, respawned when it dies'''
+        if self.session is None:
+            self.session = ShellSession(self.address, self.client)
+        logger.debug('session %s: %s' % (self.address, cmd))
+        if not self.session.is_alive():
+            before = time()
+            self.session.spawn()
+            self.latency.spawn += time() - before
+        before = time()
+        result, ret = self.session.execute(cmd)
+        self.latency.run += time() - before
+        self.latency.bytes += len(result)
+        logger.debug('ret %s' % ret)
+        if ret is not None:
+            self.succeed()
+        elif not self.session.cancelled:
+            self.fail()
+        return result
+    
+    def run_batch(self, cmds):
+        '''execute cmds in a single round trip, return their outputs in the same order'''
+        markers = dict(('TVB_PART_%d' % i, i) for i in range(len(cmds)))
+        # every marker on its own line, the previous output may not end with a newline
+        script = '; '.join('echo; echo TVB_""PART_%d; %s' % (i, cmd) for i, cmd in enumerate(cmds))
+        outputs = [[] for unused in cmds]
+        part = None
+        for line in self.run(script).splitlines():
+            if line in markers:
+                part = outputs[markers[line]]
+            elif part is not None:
+                part.append(line)
+        return ['\n'.join(lines).strip() for lines in outputs]
+    
+    def kill_session(self):
+        if self.session:
+            self.session.cancel()
+            
+    def close(self):
+        self.closed.set()
+        if self.session:
+            self.session.close()
+        for process, pump in self.pumps:
+            # the log is only complete once the pump reached the end of its output
+            pump.join(PUMP_TIMEOUT)
+            if pump.isAlive():
+                process.kill()
+                pump.join()
+        self.pumps = []
+    
     def get_process_stdout(self, process):
+        before = time()
         result = process.communicate()[0].replace('\r\r', '').strip()
+        self.latency.run += time() - before
+        self.latency.bytes += len(result)
         ret = process.wait()
         logger.debug('ret %s' % ret)
-        if ret != 0:
-            self.reconnect()
+        if ret == ADB_FAILURE:
+            self.fail()
+        else:
+            self.succeed()
         process = None
         return result
         
+    def list_devices(self):
+        if self.client:
+            try:
+                return ['%s\t%s' % device for device in self.client.devices()]
+            except (AdbError, socket.error), e:
+                logger.error('adb devices failed: %s' % e)
+                return []
+        return self.execmd('adb devices').splitlines()
+    
+    def host_command(self, command):
+        '''connect or disconnect the device, return the message of adb'''
+        if self.client:
+            try:
+                return getattr(self.client, command)(self.device)
+            except (AdbError, socket.error), e:
+                return str(e)
+        return self.execmd('adb %s %s' % (command, self.device))
+        
     def is_connected(self, retry=True):
-        results = filter(lambda line: self.device in line, self.execmd('adb devices').splitlines())
+        results = filter(lambda line: self.device in line, self.list_devices())
         if len(results) == 1:
             result = results[0]
             if 'device' in result:
@@ -83,7 +356,7 @@ class Device(object):
         if '.' not in self.device:
             self.address = self.device
             return
-        result = self.execmd('adb connect %s' % self.device)
+        result = self.host_command('connect')
         logger.info(result)
         if 'connected to' in result:
             self.address = result.split()[-1]
@@ -95,11 +368,73 @@ class Device(object):
     def disconnect(self):
         if '.' not in self.device:
             return
-        self.execmd('adb disconnect %s' % self.device)
+        self.host_command('disconnect')
         
     def reconnect(self):
         if '.' not in self.device:
             return
-        logger.error('try reconnect')
+        logger.error('%s try reconnect' % self.device)
         self.disconnect()
-        logger.info(self.execmd('adb connect %s' % self.device))
+        logger.info(self.host_command('connect'))
+        if self.session:
+            self.session.address = self.address
+
+    def is_online(self):
+        return self.state != OFFLINE
+    
+    def set_state(self, state):
+        if state != self.state:
+            (logger.info if state == HEALTHY else logger.error)('%s %s -> %s' % (self.device, self.state, state))
+            self.state = state
+    
+    def succeed(self):
+        with self.health_lock:
+            self.set_state(HEALTHY)
+    
+    def fail(self):
+        '''a transport failure, the device is degraded and reconnected in the background'''
+        with self.health_lock:
+            if self.state == HEALTHY:
+                self.set_state(DEGRADED)
+            if self.closed.is_set() or (self.recovering and self.recovering.isAlive()):
+                return
+            self.recovering = Thread(target=self.recover, name='%s reconnect' % self.device)
+            self.recovering.setDaemon(True)
+            self.recovering.start()
+            
+    def recover(self):
+        '''reconnect until the device answers, it is offline after the first failed attempt'''
+        delay = BACKOFF_MIN
+        while self.state != HEALTHY and not self.closed.is_set():
+            # a device that still answers keeps its connection, reconnecting would break the other adb calls
+            if self.answers():
+                self.succeed()
+                return
+            self.reconnect()
+            if self.answers():
+                self.succeed()
+                return
+            with self.health_lock:
+                self.set_state(OFFLINE)
+            logger.error('%s does not answer, retry in %s seconds' % (self.device, delay))
+            self.closed.wait(delay)
+            delay = min(delay * 2, BACKOFF_MAX)
+            
+    def answers(self):
+        '''whether the device runs a command within PROBE_TIMEOUT seconds'''
+        try:
+            if self.client:
+                process = self.client.shell(self.address, 'echo TVB_OK')
+            else:
+                # without a host shell in between, killing adb ends the output
+                process = subprocess.Popen(['adb', '-s', self.address, 'shell', 'echo TVB_OK'], stdout=subprocess.PIPE)
+            timer = Timer(PROBE_TIMEOUT, process.kill)
+            timer.setDaemon(True)
+            timer.start()
+            try:
+                return 'TVB_OK' in process.communicate()[0]
+            finally:
+                timer.cancel()
+        except Exception, e:
+            logger.debug('%s probe failed: %s' % (self.device, e))
+            return False
@@ -13,27 +13,101 @@ import xlsxwriter
 import logging
 logger = logging.getLogger(__name__)
 
+def lttb(points, threshold):
+    '''Largest-Triangle-Three-Buckets, keep threshold of points [(x, y)] preserving the shape'''
+    count = len(points)
+    if threshold >= count or threshold < 3:
+        return points
+    sampled = [points[0]]
+    every = float(count - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, count)
+        avg_x = avg_y = 0.0
+        for x, y in points[avg_start:avg_end]:
+            avg_x += x
+            avg_y += y
+        avg_x /= avg_end - avg_start
+        avg_y /= avg_end - avg_start
+        ax, ay = points[a]
+        max_area, next_a = -1, None
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area, next_a = area, j
+        sampled.append(points[next_a])
+        a = next_a
+    sampled.append(points[-1])
+    return sampled
+
+def downsample(lines, columns, budget):
+    '''row indexes to chart, the union of every series reduced by LTTB to its share of budget'''
+    if hasattr(lines, 'columns'):
+        # MetricStore, read the value arrays instead of formatting every row
+        series = [[(i, value) for i, (value, present) in enumerate(zip(column, mask)) if present]
+                  for column, mask in zip(lines.columns, lines.masks)]
+    else:
+        series = [[] for unused in range(1, columns)]
+        for i, line in enumerate(lines):
+            for j in range(1, columns):
+                if line[j] != '':
+                    series[j - 1].append((i, line[j]))
+    threshold = max(budget / max(columns - 1, 1), 3)
+    indexes = set()
+    for points in series:
+        indexes.update(x for x, y in lttb(points, threshold))
+    return sorted(indexes)
+
+def get_line(lines, index):
+    if hasattr(lines, 'get_row'):
+        return lines.get_row(index)
+    return lines[index]
+
 class Excel(object):
-    def __init__(self, book_name):
-        self.workbook = xlsxwriter.Workbook(book_name)
-        
-    def add_sheet(self, sheet_name, x_axis, y_axis, headings, lines):
+    def __init__(self, book_name, chart_points=0):
+        # rows are flushed as soon as they are written
+        self.workbook = xlsxwriter.Workbook(book_name, {'constant_memory': True})
+        self.chart_points = chart_points
+
+    def add_sheet(self, sheet_name, x_axis, y_axis, headings, lines, secondary=None):
+        '''secondary is (y2 axis name, headings drawn against it)'''
         worksheet = self.workbook.add_worksheet(sheet_name)
-        worksheet.write_row('A1', headings)
-        for i, line in enumerate(lines, 2):
-            worksheet.write_row('A%d' % i, line)
         columns = len(headings)
         rows = len(lines)
+        # beyond the point budget the chart reads a reduced copy placed right of the data
+        chart_rows = None
+        if self.chart_points and columns > 1 and rows > self.chart_points:
+            chart_rows = downsample(lines, columns, self.chart_points)
+            chart_column = columns + 1
+        worksheet.write_row('A1', headings)
+        if chart_rows is None:
+            for i, line in enumerate(lines, 2):
+                worksheet.write_row('A%d' % i, line)
+        else:
+            worksheet.write_row(0, chart_column, ['chart %s' % heading for heading in headings])
+            # constant_memory drops a row written after a later one, so the copy shares the rows of the data
+            for i, line in enumerate(lines):
+                worksheet.write_row(i + 1, 0, line)
+                if i < len(chart_rows):
+                    worksheet.write_row(i + 1, chart_column, get_line(lines, chart_rows[i]))
         if columns > 1 and rows > 1:
             chart = self.workbook.add_chart({'type': 'line'})
+            first_column, last_row = 0, rows
+            if chart_rows is not None:
+                first_column, last_row = chart_column, len(chart_rows)
             for j in range(1, columns):
                 chart.add_series({'name':       [sheet_name, 0, j],
-                                  'categories': [sheet_name, 1, 0, rows, 0],
-                                  'values':     [sheet_name, 1, j, rows, j]})
+                                  'categories': [sheet_name, 1, first_column, last_row, first_column],
+                                  'values':     [sheet_name, 1, first_column + j, last_row, first_column + j],
+                                  'y2_axis':    secondary is not None and headings[j] in secondary[1]})
             chart.set_title ({'name': sheet_name.replace('.', ' ').title()})
             chart.set_x_axis({'name': x_axis})
             chart.set_y_axis({'name': y_axis})
+            if secondary is not None:
+                chart.set_y2_axis({'name': secondary[0]})
             worksheet.insert_chart('B3', chart, {'x_scale': 2, 'y_scale': 2})
-    
+
     def save(self):
         self.workbook.close()
@@ -0,0 +1,214 @@
+# encoding: utf-8
+'''
+@author:     Juncheng Chen
+
+@copyright:  1999-2015 Alibaba.com. All rights reserved.
+
+@license:    Apache Software License 2.0
+
+@contact:    juncheng.cjc@outlook.com
+'''
+import os
+import gzip
+import shutil
+import struct
+
+import logging
+logger = logging.getLogger(__name__)
+
+HPROF_MODES = ['keep', 'delete', 'compress']
+READ_SIZE = 1024 * 1024
+
+# top level records
+STRING, LOAD_CLASS, HEAP_DUMP, HEAP_DUMP_SEGMENT = 0x01, 0x02, 0x0C, 0x1C
+# tag, time offset and length of a top level record
+RECORD = struct.Struct('>BII')
+# heap dump records
+CLASS_DUMP, INSTANCE_DUMP, OBJECT_ARRAY_DUMP, PRIMITIVE_ARRAY_DUMP, PRIMITIVE_ARRAY_NODATA_DUMP = 0x20, 0x21, 0x22, 0x23, 0xC3
+OBJECT = 2
+# byte size of the basic types, an object is an id
+TYPE_SIZES = {4: 1, 5: 2, 6: 4, 7: 8, 8: 1, 9: 2, 10: 4, 11: 8}
+TYPE_NAMES = {4: 'boolean[]', 5: 'char[]', 6: 'float[]', 7: 'double[]', 8: 'byte[]', 9: 'short[]', 10: 'int[]', 11: 'long[]'}
+# heap dump records made of ids and u4 only, as (ids, u4s), android adds the 0x8x, 0x90 and 0xFE ones
+ROOTS = {0xFF: (1, 0), 0x01: (2, 0), 0x02: (1, 2), 0x03: (1, 2), 0x04: (1, 1), 0x05: (1, 0), 0x06: (1, 1), 0x07: (1, 0), 0x08: (1, 2),
+         0x89: (1, 0), 0x8A: (1, 0), 0x8B: (1, 0), 0x8C: (1, 0), 0x8D: (1, 0), 0x8E: (1, 2), 0x90: (1, 0), 0xFE: (1, 1)}
+
+class Reader(object):
+    '''Big endian reads over a file through a bounded buffer, large skips seek.'''
+    def __init__(self, f):
+        self.file = f
+        self.buffer = ''
+        self.position = 0
+        # bytes consumed from the start of the file
+        self.offset = 0
+
+    def ensure(self, size):
+        if len(self.buffer) - self.position < size:
+            self.buffer = self.buffer[self.position:] + self.file.read(max(size, READ_SIZE))
+            self.position = 0
+            if len(self.buffer) < size:
+                raise EOFError('hprof ends in the middle of a record')
+
+    def read(self, size):
+        self.ensure(size)
+        data = self.buffer[self.position:self.position + size]
+        self.position += size
+        self.offset += size
+        return data
+
+    def unpack(self, fmt):
+        self.ensure(fmt.size)
+        values = fmt.unpack_from(self.buffer, self.position)
+        self.position += fmt.size
+        self.offset += fmt.size
+        return values
+
+    def skip(self, size):
+        available = len(self.buffer) - self.position
+        if size <= available:
+            self.position += size
+        else:
+            self.file.seek(size - available, os.SEEK_CUR)
+            self.buffer, self.position = '', 0
+        self.offset += size
+
+    def at_end(self):
+        if self.position < len(self.buffer):
+            return False
+        self.buffer, self.position = self.file.read(READ_SIZE), 0
+        return not self.buffer
+
+class HprofHistogram(object):
+    '''Instance count and shallow size of every class of a heap dump, read record by record.'''
+    def __init__(self, path):
+        self.path = path
+        # class id: name string id
+        self.class_names = {}
+        # string id: class name
+        self.names = {}
+        # class id: [count, shallow bytes]
+        self.instances = {}
+        # array type name: [count, shallow bytes]
+        self.arrays = {}
+        with open(path, 'rb') as f:
+            self.parse(Reader(f))
+            f.seek(0)
+            self.parse_names(Reader(f))
+
+    def parse_header(self, reader):
+        header = ''
+        while not header.endswith('\0'):
+            header += reader.read(1)
+        if not header.startswith('JAVA PROFILE'):
+            raise ValueError('%s is not a hprof' % self.path)
+        self.id_size = reader.unpack(struct.Struct('>I'))[0]
+        self.id = struct.Struct('>I' if self.id_size == 4 else '>Q')
+        reader.skip(8)
+
+    def parse(self, reader):
+        self.parse_header(reader)
+        while not reader.at_end():
+            tag, unused, length = reader.unpack(RECORD)
+            if tag == LOAD_CLASS:
+                unused, class_id, unused, name_id = reader.unpack(struct.Struct('>I%sI%s' % ((self.id.format[1],) * 2)))
+                self.class_names[class_id] = name_id
+            elif tag in (HEAP_DUMP, HEAP_DUMP_SEGMENT):
+                self.parse_heap(reader, reader.offset + length)
+            else:
+                reader.skip(length)
+
+    def parse_names(self, reader):
+        '''read the strings naming the classes with instances, the others are skipped'''
+        wanted = set(self.class_names[class_id] for class_id in self.instances if class_id in self.class_names)
+        self.parse_header(reader)
+        while wanted and not reader.at_end():
+            tag, unused, length = reader.unpack(RECORD)
+            if tag != STRING:
+                reader.skip(length)
+                continue
+            string_id = reader.unpack(self.id)[0]
+            if string_id in wanted:
+                wanted.remove(string_id)
+                self.names[string_id] = reader.read(length - self.id_size)
+            else:
+                reader.skip(length - self.id_size)
+
+    def parse_heap(self, reader, end):
+        ids = self.id_size
+        instance = struct.Struct('>%sI%sI' % ((self.id.format[1],) * 2))
+        array = struct.Struct('>%sII' % self.id.format[1])
+        u1, u2 = struct.Struct('>B'), struct.Struct('>H')
+        while reader.offset < end:
+            tag = reader.unpack(u1)[0]
+            if tag in ROOTS:
+                id_count, u4_count = ROOTS[tag]
+                reader.skip(id_count * ids + u4_count * 4)
+            elif tag == INSTANCE_DUMP:
+                unused, unused, class_id, size = reader.unpack(instance)
+                reader.skip(size)
+                self.add(self.instances, class_id, size)
+            elif tag == OBJECT_ARRAY_DUMP:
+                unused, unused, count = reader.unpack(array)
+                class_id = reader.unpack(self.id)[0]
+                reader.skip(count * ids)
+                self.add(self.instances, class_id, count * ids)
+            elif tag in (PRIMITIVE_ARRAY_DUMP, PRIMITIVE_ARRAY_NODATA_DUMP):
+                unused, unused, count = reader.unpack(array)
+                kind = reader.unpack(u1)[0]
+                size = count * TYPE_SIZES.get(kind, 1)
+                if tag == PRIMITIVE_ARRAY_DUMP:
+                    reader.skip(size)
+                self.add(self.arrays, TYPE_NAMES.get(kind, 'unknown[]'), size)
+            elif tag == CLASS_DUMP:
+                reader.skip(7 * ids + 8)
+                for unused in range(reader.unpack(u2)[0]):
+                    # constant pool entries, index then value
+                    reader.skip(2)
+                    reader.skip(self.get_value_size(reader.unpack(u1)[0]))
+                for unused in range(reader.unpack(u2)[0]):
+                    reader.skip(ids)
+                    reader.skip(self.get_value_size(reader.unpack(u1)[0]))
+                reader.skip(reader.unpack(u2)[0] * (ids + 1))
+            else:
+                raise ValueError('unknown heap dump record 0x%x at %d' % (tag, reader.offset - 1))
+
+    def get_value_size(self, kind):
+        return self.id_size if kind == OBJECT else TYPE_SIZES[kind]
+
+    def add(self, table, key, size):
+        entry = table.get(key)
+        if entry is None:
+            table[key] = [1, size]
+        else:
+            entry[0] += 1
+            entry[1] += size
+
+    def get_histogram(self):
+        '''[(shallow bytes, count, class name)] from the largest'''
+        histogram = {}
+        tables = [(self.names.get(self.class_names.get(class_id), '0x%x' % class_id), entry) for class_id, entry in self.instances.iteritems()]
+        for name, entry in tables + self.arrays.items():
+            total = histogram.setdefault(name, [0, 0])
+            total[0] += entry[0]
+            total[1] += entry[1]
+        return sorted(((size, count, name) for name, (count, size) in histogram.iteritems()), reverse=True)
+
+def summarize(path, limit):
+    '''class histogram of the hprof at path as text, the total first then the limit largest classes'''
+    histogram = HprofHistogram(path).get_histogram()
+    lines = ['TOTAL %d %d' % (sum(size for size, count, name in histogram), sum(count for size, count, name in histogram))]
+    lines += ['%d %d %s' % entry for entry in histogram[:limit]]
+    return '\n'.join(lines)
+
+def dispose(path, mode):
+    '''keep, delete or gzip the raw dump once it was summarized'''
+    if mode == 'delete':
+        os.remove(path)
+    elif mode == 'compress':
+        with open(path, 'rb') as src:
+            dst = gzip.open('%s.gz' % path, 'wb')
+            try:
+                shutil.copyfileobj(src, dst, READ_SIZE)
+            finally:
+                dst.close()
+        os.remove(path)
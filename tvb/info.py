@@ -10,95 +10,250 @@
 '''
 import os
 import re
+import mmap
+import math
+
+from tvb.cache import ParseCache
+from tvb.storage import is_compressed, read_chunks
+from tvb.store import MetricStore
+from tvb.command import GFXINFO_MARK
 
 import logging
 logger = logging.getLogger(__name__)
 
 class Data(object):
-    def __init__(self, timestamp):
+    '''One sample, a view on buffer[begin:end] that is only copied when a plugin needs the text.'''
+    def __init__(self, timestamp, buffer='', begin=0, end=None):
         self.timestamp = timestamp
-        self.lines = []
+        self.buffer = buffer
+        self.begin = begin
+        self.end = len(buffer) if end is None else end
         self.data = None
-        
-    def add_line(self, line):
-        self.lines.append(line)
+        self.lines = None
         
     def get_data(self):
-        if not self.data:
-            self.data = ''.join(self.lines)
+        if self.data is None:
+            self.data = self.buffer[self.begin:self.end]
         return self.data
+    
+    def get_lines(self):
+        if self.lines is None:
+            self.lines = self.get_data().split('\n')
+        return self.lines
+    
+    def search(self, regex):
+        return regex.search(self.buffer, self.begin, self.end)
+    
+    def finditer(self, regex):
+        return regex.finditer(self.buffer, self.begin, self.end)
+    
+class Parser(object):
+    '''Evaluate all plugins of an Info over a sample in one pass.
+
+    Plugins with a keyword only match inside one line, so every line of
+    the sample is examined once and handed to the plugins whose keyword
+    it contains. The other plugins still get the whole sample.
+    '''
+    def __init__(self, plugins):
+        self.plugins = plugins
+        self.keywords = []
+        self.text_plugins = []
+        for plugin in plugins:
+            keyword = getattr(plugin, 'keyword', None)
+            if keyword:
+                for kw, kw_plugins in self.keywords:
+                    if kw == keyword:
+                        kw_plugins.append(plugin)
+                        break
+                else:
+                    self.keywords.append((keyword, [plugin]))
+            else:
+                self.text_plugins.append(plugin)
+                
+    def parse(self, data):
+        rowds = {}
+        for line in data.get_lines():
+            for keyword, plugins in self.keywords:
+                if keyword in line:
+                    for plugin in plugins:
+                        if plugin not in rowds:
+                            rowd = plugin.match(line)
+                            if rowd is not None:
+                                rowds[plugin] = rowd
+        for keyword, plugins in self.keywords:
+            for plugin in plugins:
+                plugin.parse_row(data, rowds.get(plugin))
+        for plugin in self.text_plugins:
+            plugin.parse(data)
         
+MAP_WINDOW = 16 * 1024 * 1024
+
+def find_header(buffer, position):
+    if buffer[position:position + 2] == '>>':
+        return position
+    position = buffer.find('\n>>', position)
+    if position >= 0:
+        return position + 1
+    
 class Info(object):
-    def __init__(self, device_dir, file_name, process_names=[], core_num=1):
-        self.core_num = str(core_num)
+    def __init__(self, device_dir, file_name, process_names=[], core_num=1, top=None, cache=False):
+        self.core_num = core_num
+        self.top = top
         self.plugins = self._get_plugins(process_names)
-        with open(os.path.join(device_dir, file_name), 'r') as f:
-            data = None
-            for line in f:
-                if line.startswith('>>'):
-                    if data:
-                        for plugin in self.plugins:
-                            plugin.parse(data)
-                    data = Data(line.split('>>')[1])
-                elif data:
-                    data.add_line(line)
+        self.parser = Parser(self.plugins)
+        if file_name is None:
+            # samples are fed to self.parser one by one, see MetricSink
+            return
+        # file_name may list the rotated segments of the log, oldest first, then the active file
+        paths = [os.path.join(device_dir, name) for name in (file_name if isinstance(file_name, list) else [file_name])]
+        # a compressed log is decompressed from its start anyway, an offset saves nothing
+        if cache and not [path for path in paths if is_compressed(path)]:
+            self.parse_cached(paths)
+        else:
+            self.parse_segments(paths[:-1], self.parser)
+            self.parse_file(paths[-1], self.parser)
+            
+    def parse_segments(self, paths, parser):
+        # segments are complete, their last sample is parsed too
+        for path in paths:
+            self.parse_file(path, parser, final=True)
+            
+    def parse_file(self, path, parser, start=0, end=None, final=False):
+        '''parse the samples starting in [start, end), return the offset of the first sample left unparsed'''
+        if is_compressed(path):
+            return self.parse_stream(path, parser, final)
+        size = os.path.getsize(path)
+        window = MAP_WINDOW
+        with open(path, 'rb') as f:
+            # map the log a window at a time so resident memory stays bounded by the window
+            while start < size and (end is None or start < end):
+                base = start - start % mmap.ALLOCATIONGRANULARITY
+                length = min(window, size - base)
+                buffer = mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ, offset=base)
+                try:
+                    offset = base + self.parse_buffer(buffer, parser, start - base, None if end is None else end - base,
+                                                      final and base + length >= size)
+                finally:
+                    buffer.close()
+                if base + length >= size:
+                    return offset
+                if offset == start:
+                    # a sample larger than the window
+                    window *= 2
+                start = offset
+        return start
+                
+    def parse_stream(self, path, parser, final=False):
+        '''parse a compressed log chunk by chunk, return the decompressed offset of the first sample left unparsed'''
+        buffer, offset = '', 0
+        for chunk in read_chunks(path):
+            buffer += chunk
+            parsed = self.parse_buffer(buffer, parser)
+            buffer = buffer[parsed:]
+            offset += parsed
+        if final and buffer:
+            offset += self.parse_buffer(buffer, parser, final=True)
+        return offset
+                
+    def parse_buffer(self, buffer, parser, start=0, end=None, final=False):
+        # samples are the text between two '>>timestamp>>' header lines, the last one may still be written unless final
+        header = find_header(buffer, start)
+        while header is not None and (end is None or header < end):
+            line_end = buffer.find('\n', header)
+            if line_end < 0:
+                break
+            next_header = find_header(buffer, line_end)
+            if next_header is None:
+                if not final or line_end + 1 >= len(buffer):
+                    break
+                next_header = len(buffer)
+            parser.parse(Data(buffer[header:line_end].split('>>')[1], buffer, line_end + 1, next_header))
+            header = next_header
+        return start if header is None else header
+    
+    def parse_cached(self, paths):
+        '''parse only the samples appended since the cache was saved, and the old ones only for new plugins'''
+        path = paths[-1]
+        cache = ParseCache(path)
+        # the cache of the active file covers the segments rotated before it
+        params = (self.__class__.__name__, self.core_num, [os.path.basename(segment) for segment in paths[:-1]])
+        offset, states = cache.load(params)
+        new_plugins = []
+        for plugin in self.plugins:
+            if plugin.key in states:
+                plugin.set_state(states[plugin.key])
+            else:
+                new_plugins.append(plugin)
+        if not states:
+            self.parse_segments(paths[:-1], self.parser)
+        elif new_plugins:
+            logger.debug('parse %s for %s' % (path, ', '.join(plugin.key for plugin in new_plugins)))
+            parser = Parser(new_plugins)
+            self.parse_segments(paths[:-1], parser)
+            if offset:
+                self.parse_file(path, parser, 0, offset)
+        offset = self.parse_file(path, self.parser, offset)
+        cache.save(params, offset, dict((plugin.key, plugin.get_state()) for plugin in self.plugins))
                     
     def _get_plugins(self, process_names):
-        plugins = self.get_plugins()
-        for process_name in process_names:
-            plugins += self.get_plugins_with_process_name(process_name)
-        return plugins
+        return self.get_plugins() + self.get_process_plugins(process_names)
                     
     def get_plugins(self):
         return []
     
+    def get_process_plugins(self, process_names):
+        plugins = []
+        for process_name in process_names:
+            plugins += self.get_plugins_with_process_name(process_name)
+        return plugins
+    
     def get_plugins_with_process_name(self, process_name):
         return []
     
     def get_sheet_list(self):
-        return (plugin.get_sheet() for plugin in self.plugins)
+        for plugin in self.plugins:
+            for sheet in plugin.get_sheets():
+                yield sheet
     
 class CpuInfo(Info):
     def get_plugins(self):
         return [RegexPlugin('cpuinfo.load', 'load (%s)' % self.core_num, ['lavg_1', 'lavg_5', 'lavg_15'],
-                            r'Load: (?P<lavg_1>.*) / (?P<lavg_5>.*) / (?P<lavg_15>.*)'),
+                            r'Load: (?P<lavg_1>.*) / (?P<lavg_5>.*) / (?P<lavg_15>.*)', keyword='Load: '),
                 CpuTotalPlugin()]
     
-    def get_plugins_with_process_name(self, process_name):
-        short_name = process_name.split('.')[-1]
-        return [RegexPlugin('cpuinfo.usage.%s' % short_name, 'usage (100%)', ['usage', 'user', 'kernel'],
-                            r'(?P<usage>\d.*)%% \d*/%s: (?P<user>.*)%% user \+ (?P<kernel>.*)%% kernel.*' % process_name, operation='float("%s") / ' + self.core_num),
-#                 RegexPlugin('cpuinfo.pid.%s' % short_name, 'pid', ['pid'],
-#                             r'\d.*%% (?P<pid>\d.*)/%s: .*' % process_name)
-                ]
+    def get_process_plugins(self, process_names):
+        if not process_names and self.top is None:
+            return []
+        return [ProcessPlugin(parse_cpuinfo_table, [('cpuinfo.usage', 'usage (100%)', ['usage', 'user', 'kernel'], Operation(divisor=self.core_num))],
+                              process_names, self.top)]
         
 class MemInfo(Info):
     def get_plugins(self):
         return [RegexPlugin('meminfo.uptime', 'uptime (second)', ['uptime'],
-                            r'Uptime: (?P<uptime>.*) Realtime: .*', operation='%s / 6000.0'),
+                            r'Uptime: (?P<uptime>.*) Realtime: .*', operation=Operation(divisor=6000.0), keyword='Uptime: '),
                 RegexPlugin('meminfo.total', 'meminfo (MB)', ['Total', 'Free', 'Used', 'Lost'],
                             r'Total (RAM|PSS): (?P<Total>\d.*?) kB.* Free (RAM|PSS): (?P<Free>\d.*?) kB.* Used (RAM|PSS): (?P<Used>\d.*?) kB.* Lost (RAM|PSS): (?P<Lost>\d.*?) kB.*',
-                            re.DOTALL, operation='%s / 1024.0'),]
+                            re.DOTALL, operation=Operation(divisor=1024.0)),]
     
-    def get_plugins_with_process_name(self, process_name):
-        short_name = process_name.split('.')[-1]
-        return [RegexPlugin('meminfo.pss.%s' % short_name, 'pss (MB)', ['pss'],
-                            r'(?P<pss>\d.*?) kB: %s.*' % process_name, operation='%s / 1024.0'),
-#                 RegexPlugin('meminfo.pid.%s' % short_name, 'pid', ['pid'],
-#                             r'kB: %s \(pid (?P<pid>\d.*?) .*' % process_name)
-                            ]
+    def get_process_plugins(self, process_names):
+        if not process_names and self.top is None:
+            return []
+        return [ProcessPlugin(parse_meminfo_table, [('meminfo.pss', 'pss (MB)', ['pss'], Operation(divisor=1024.0))],
+                              process_names, self.top)]
         
 class TopInfo(Info):
     def get_plugins(self):
         return [RegexPlugin('top.cpu', 'cpu (100%)', ['User', 'System', 'IOW', 'IRQ'],
-                            r'User (?P<User>\d.*?)%, System (?P<System>\d.*?)%, IOW (?P<IOW>\d.*?)%, IRQ (?P<IRQ>\d.*?)%'),
+                            r'User (?P<User>\d.*?)%, System (?P<System>\d.*?)%, IOW (?P<IOW>\d.*?)%, IRQ (?P<IRQ>\d.*?)%', keyword=', IOW '),
                 ]
     
-    def get_plugins_with_process_name(self, process_name):
-        short_name = process_name.split('.')[-1]
-        return [RegexPlugin('top.cpu.%s' % short_name, 'cpu (100%)', ['cpu'], r'.* (?P<cpu>\d.*?)%% .* %s' % process_name),
-                RegexPlugin('top.pid.%s' % short_name, 'pid', ['pid'], r'(?P<pid>\d.*?) .* %s' % process_name),
-                RegexPlugin('top.thr.%s' % short_name, 'thr', ['thr'], r'.* \d*%%\s\D\s*(?P<thr>\d*) .* %s' % process_name)]
+    def get_process_plugins(self, process_names):
+        if not process_names and self.top is None:
+            return []
+        return [ProcessPlugin(parse_top_table, [('top.cpu', 'cpu (100%)', ['cpu'], float),
+                                                ('top.pid', 'pid', ['pid'], float),
+                                                ('top.thr', 'thr', ['thr'], float)],
+                              process_names, self.top)]
         
 class Temp0Info(Info):
     def get_plugins(self):
@@ -108,26 +263,78 @@ class Temp1Info(Info):
     def get_plugins(self):
         return [RegexPlugin('temperature1', u'temperature (℃)', ['temperature'], r'(?P<temperature>\d*)')]
     
+class LatencyInfo(Info):
+    def get_plugins(self):
+        return [LatencyPlugin('latency.run', 'run (ms)', 'run', operation=Operation(multiplier=1000)),
+                LatencyPlugin('latency.spawn', 'spawn (ms)', 'spawn', operation=Operation(multiplier=1000)),
+                LatencyPlugin('latency.bytes', 'bytes', 'bytes')]
+    
+class ProcfsInfo(Info):
+    def get_plugins(self):
+        return [ProcCpuPlugin(),
+                ProcMeminfoPlugin()]
+    
+    def get_process_plugins(self, process_names):
+        if not process_names and self.top is None:
+            return []
+        return [ProcessPlugin(ProcStatTable(process_names), [('procfs.cpu', 'cpu (100%)', ['cpu'], float),
+                                                             ('procfs.rss', 'rss (MB)', ['rss'], Operation(divisor=1024.0))],
+                              process_names, self.top)]
+    
+class SysfsInfo(Info):
+    def get_plugins(self):
+        self.thermal = SysfsPlugin('sysfs.thermal', u'temperature (℃)', SYSFS_THERMAL, celsius)
+        self.cpufreq = SysfsPlugin('sysfs.cpufreq', 'frequency (MHz)', SYSFS_CPUFREQ, Operation(divisor=1000.0))
+        return [self.thermal, self.cpufreq,
+                SysfsPlugin('sysfs.devfreq', 'frequency (MHz)', SYSFS_DEVFREQ, Operation(divisor=1000000.0))]
+    
+    def get_sheet_list(self):
+        for sheet in Info.get_sheet_list(self):
+            yield sheet
+        # temperatures with the current cpu frequencies on the secondary axis show throttling
+        store = MetricStore([], self.thermal.store.timestamps, self.thermal.store.labels)
+        for heading in self.thermal.store.headings:
+            store.merge(heading, self.thermal.store, heading)
+        frequencies = [heading for heading in self.cpufreq.store.headings if heading.endswith(' cur')]
+        for heading in frequencies:
+            store.merge(heading, self.cpufreq.store, heading)
+        if store.headings:
+            yield 'sysfs.throttle', 'time (m/d H:M:S)', self.thermal.y_axis, ['timestamp'] + store.headings, store, (self.cpufreq.y_axis, frequencies)
+    
+class Operation(object):
+    '''Precompiled value conversion, float(value) * multiplier / divisor.'''
+    def __init__(self, divisor=None, multiplier=None):
+        self.divisor = divisor
+        self.multiplier = multiplier
+        
+    def __call__(self, value):
+        value = float(value)
+        if self.multiplier is not None:
+            value *= self.multiplier
+        if self.divisor is not None:
+            value /= self.divisor
+        return value
+    
+def convert_values(headings, operation, rowd):
+    '''converted value of every heading in rowd, None for the missing ones'''
+    values = []
+    for key in headings:
+        try:
+            values.append(operation(rowd.get(key)))
+        except (AttributeError, TypeError, ValueError):
+            values.append(None)
+    return values
+    
 class Plugin(object):
-    def __init__(self, name, y_axis, headings, operation='float("%s")'):
+    def __init__(self, name, y_axis, headings, operation=float):
         self.name = name
         self.y_axis = y_axis
         self.headings = headings
         self.operation = operation
-        self.rows = []
+        self.store = MetricStore(headings)
         
     def parse_row(self, data, rowd):
-        row = [data.timestamp]
-        if rowd:
-            for key in self.headings:
-                try:
-                    row.append(eval(self.operation % rowd.get(key)))
-                except:
-                    row.append('')
-        else:
-            for unused in self.headings:
-                row.append('')
-        self.rows.append(row)
+        self.store.append(data.timestamp, convert_values(self.headings, self.operation, rowd))
         
     def parse_rowd(self, data):
         pass
@@ -136,20 +343,35 @@ class Plugin(object):
         self.parse_row(data, self.parse_rowd(data))
     
     def get_sheet(self):
-        return self.name, 'time (m/d H:M:S)', self.y_axis, ['timestamp'] + self.headings, self.rows
+        return self.name, 'time (m/d H:M:S)', self.y_axis, ['timestamp'] + self.store.headings, self.store
+    
+    def get_sheets(self):
+        return [self.get_sheet()]
+    
+    @property
+    def key(self):
+        return self.name
+    
+    def get_state(self):
+        return self.store
+    
+    def set_state(self, state):
+        self.store = state
 
 class RegexPlugin(Plugin):
-    def __init__(self, name, y_axis_unit, headings, pattern, flags=None, operation='float("%s")'):
+    def __init__(self, name, y_axis_unit, headings, pattern, flags=0, operation=float, keyword=None):
         Plugin.__init__(self, name, y_axis_unit, headings, operation)
-        self.flags = flags
-        self.pattern = pattern
+        self.regex = re.compile(pattern, flags)
+        # literal every match contains, only set when the pattern cannot span lines
+        self.keyword = keyword
+        
+    def match(self, line):
+        m = self.regex.search(line)
+        if m:
+            return m.groupdict()
         
     def parse_rowd(self, data):
-        if self.flags:
-            p = re.compile(self.pattern, self.flags)
-        else:
-            p = re.compile(self.pattern)
-        m = p.search(data.get_data())
+        m = data.search(self.regex)
         if m:
             return m.groupdict()
     
@@ -170,11 +392,433 @@ class CpuTotalPlugin(Plugin):
                 rowd[items[i * 2 + 1]] = items[i * 2]
             return rowd
     
+class LatencyPlugin(Plugin):
+    '''One column per command, the columns are discovered while parsing.'''
+    pattern = re.compile(r'(?P<name>\S+) spawn=(?P<spawn>\S+) run=(?P<run>\S+) bytes=(?P<bytes>\d+)')
+    
+    def __init__(self, name, y_axis, field, operation=float):
+        Plugin.__init__(self, name, y_axis, [], operation)
+        self.field = field
+        
+    def parse(self, data):
+        rowd = {}
+        for m in data.finditer(self.pattern):
+            if m.group('name') not in self.store.headings:
+                self.store.add_heading(m.group('name'))
+            rowd[m.group('name')] = m.group(self.field)
+        self.store.append(data.timestamp, convert_values(self.store.headings, self.operation, rowd))
+    
+PROC_CPU_FIELDS = ['user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq']
+
+class ProcCpuPlugin(Plugin):
+    '''Utilization from the jiffies of the cpu line of /proc/stat, as deltas to the previous sample.'''
+    def __init__(self):
+        Plugin.__init__(self, 'procfs.cpu', 'cpu (100%)', ['usage', 'user', 'nice', 'system', 'iowait', 'irq', 'softirq'])
+        self.keyword = 'cpu '
+        self.last = None
+        
+    def match(self, line):
+        if line.startswith('cpu '):
+            # guest time is already part of user and nice
+            return line.split()[1:9]
+        
+    def parse_row(self, data, jiffies):
+        rowd = None
+        if jiffies:
+            jiffies = [int(value) for value in jiffies]
+            if self.last is not None and len(self.last) == len(jiffies):
+                deltas = dict(zip(PROC_CPU_FIELDS, [now - before for now, before in zip(jiffies, self.last)]))
+                total = sum(now - before for now, before in zip(jiffies, self.last))
+                if total > 0:
+                    rowd = dict((key, value * 100.0 / total) for key, value in deltas.iteritems())
+                    rowd['usage'] = 100.0 - rowd['idle']
+            self.last = jiffies
+        Plugin.parse_row(self, data, rowd)
+        
+    def get_state(self):
+        return self.store, self.last
+    
+    def set_state(self, state):
+        self.store, self.last = state
+        
+PROC_MEMINFO = re.compile(r'^(?P<key>MemTotal|MemFree|MemAvailable|Buffers|Cached):\s+(?P<value>\d+) kB', re.MULTILINE)
+
+class ProcMeminfoPlugin(Plugin):
+    def __init__(self):
+        Plugin.__init__(self, 'procfs.mem', 'meminfo (MB)', ['MemTotal', 'MemFree', 'MemAvailable', 'Buffers', 'Cached'], Operation(divisor=1024.0))
+        
+    def parse_rowd(self, data):
+        rowd = {}
+        for m in data.finditer(PROC_MEMINFO):
+            rowd.setdefault(m.group('key'), m.group('value'))
+        return rowd
+    
+PROC_TOTAL = re.compile(r'^cpu  ?(?P<jiffies>[\d ]+)$', re.MULTILINE)
+PROC_PID_STAT = re.compile(r'^(?P<pid>\d+) \((?P<comm>.*)\) \S+ (?:-?\d+ ){10}(?P<utime>\d+) (?P<stime>\d+) ', re.MULTILINE)
+PROC_PID_STATM = re.compile(r'^/proc/(?P<pid>\d+)/statm:\d+ (?P<resident>\d+)', re.MULTILINE)
+PAGE_KB = 4
+
+class ProcStatTable(object):
+    '''Process table from /proc/<pid>/stat and statm, cpu is the share of all jiffies since the previous sample.'''
+    def __init__(self, process_names):
+        # the kernel keeps the last 15 characters of a process name
+        self.names = dict((process_name[-15:], process_name) for process_name in process_names)
+        self.total = None
+        self.ticks = {}
+        
+    def __call__(self, data):
+        m = data.search(PROC_TOTAL)
+        if not m:
+            return {}
+        total = sum(int(value) for value in m.group('jiffies').split()[:8])
+        elapsed = total - self.total if self.total is not None else 0
+        self.total = total
+        resident = dict((m.group('pid'), int(m.group('resident'))) for m in data.finditer(PROC_PID_STATM))
+        table, ticks = {}, {}
+        for m in data.finditer(PROC_PID_STAT):
+            pid, comm = m.group('pid'), m.group('comm')
+            ticks[pid] = (comm, int(m.group('utime')) + int(m.group('stime')))
+            name = self.names.get(comm, comm)
+            if name in table:
+                continue
+            rowd = {'pid': pid}
+            last = self.ticks.get(pid)
+            if elapsed > 0 and last and last[0] == comm:
+                rowd['cpu'] = (ticks[pid][1] - last[1]) * 100.0 / elapsed
+            if pid in resident:
+                rowd['rss'] = resident[pid] * PAGE_KB
+            table[name] = rowd
+        self.ticks = ticks
+        return table
+    
+    def get_state(self):
+        return self.total, self.ticks
+    
+    def set_state(self, state):
+        self.total, self.ticks = state
+    
+def celsius(value):
+    # most zones report millidegrees, some degrees
+    value = float(value)
+    if abs(value) >= 1000:
+        value /= 1000.0
+    return value
+
+SYSFS_TYPE = re.compile(r'^/sys/class/thermal/(?P<node>thermal_zone\d+)/type:(?P<type>.*)$', re.MULTILINE)
+SYSFS_THERMAL = re.compile(r'^/sys/class/thermal/(?P<node>thermal_zone\d+)/temp:(?P<value>-?\d+)$', re.MULTILINE)
+SYSFS_CPUFREQ = re.compile(r'^/sys/devices/system/cpu/(?:cpufreq/)?(?P<node>policy\d+|cpu\d+)(?:/cpufreq)?/scaling_(?P<field>cur|min|max)_freq:(?P<value>\d+)$', re.MULTILINE)
+SYSFS_DEVFREQ = re.compile(r'^/sys/class/devfreq/(?P<node>[^/]+)/(?P<field>cur|min|max)_freq:(?P<value>\d+)$', re.MULTILINE)
+
+class SysfsPlugin(Plugin):
+    '''One column per sysfs node matched by regex, discovered while parsing like LatencyPlugin.'''
+    def __init__(self, name, y_axis, regex, operation=float):
+        Plugin.__init__(self, name, y_axis, [], operation)
+        self.regex = regex
+        
+    def parse(self, data):
+        types = dict((m.group('node'), m.group('type').strip()) for m in data.finditer(SYSFS_TYPE))
+        rowd = {}
+        for m in data.finditer(self.regex):
+            node = m.groupdict()
+            heading = node['node']
+            if node.get('field'):
+                heading = '%s %s' % (heading, node['field'])
+            elif heading in types:
+                heading = '%s %s' % (heading, types[heading])
+            if heading not in self.store.headings:
+                self.store.add_heading(heading)
+            rowd[heading] = node['value']
+        self.store.append(data.timestamp, convert_values(self.store.headings, self.operation, rowd))
+    
+class HistogramPlugin(Plugin):
+    '''Count the values of the "<field> <value>" lines of all samples into buckets, one row per bucket.'''
+    def __init__(self, name, x_axis, field, bounds):
+        Plugin.__init__(self, name, 'count', ['count'])
+        self.x_axis = x_axis
+        self.prefix = '%s ' % field
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        
+    def parse(self, data):
+        for line in data.get_lines():
+            if line.startswith(self.prefix):
+                value = float(line[len(self.prefix):])
+                index = 0
+                while index < len(self.bounds) and value >= self.bounds[index]:
+                    index += 1
+                self.counts[index] += 1
+                
+    def get_sheet(self):
+        store = MetricStore(['count'])
+        lower = 0
+        for bound, count in zip(self.bounds + [None], self.counts):
+            # bucket labels are kept as timestamps that do not parse, see MetricStore.labels
+            store.append('%s-%s' % (lower, bound) if bound is not None else '>=%s' % lower, [count])
+            lower = bound
+        return self.name, self.x_axis, self.y_axis, [self.x_axis, 'count'], store
+    
+    def get_state(self):
+        return self.counts
+    
+    def set_state(self, state):
+        self.counts = state
+    
+# a frame longer than one vsync at 60 Hz is janky, frozen frames hang the ui
+JANK_MS = 1000.0 / 60
+FROZEN_MS = 700
+PERCENTILES = [50, 90, 95, 99]
+
+def percentile(values, p):
+    '''nearest rank percentile of sorted values'''
+    return values[max(int(math.ceil(p / 100.0 * len(values))) - 1, 0)]
+
+class FramePlugin(Plugin):
+    '''Frame time percentiles and jank counts of one process over the frames of every sample, see GfxinfoLoopCommand.'''
+    def __init__(self, process_name):
+        Plugin.__init__(self, 'gfxinfo.%s' % process_name, 'frame time (ms)', ['p%d' % p for p in PERCENTILES] + ['frames', 'janky', 'frozen'])
+        self.process_name = process_name
+        
+    def get_durations(self, data):
+        durations, section, columns = [], False, None
+        for line in data.get_lines():
+            if line.startswith(GFXINFO_MARK):
+                section = line[len(GFXINFO_MARK):].strip() == self.process_name
+                continue
+            if not section:
+                continue
+            items = line.split(',')
+            if items[0] == 'Flags':
+                columns = items.index('IntendedVsync'), items.index('FrameCompleted')
+            elif columns and items[0] == '0' and len(items) > columns[1]:
+                # frames with flags set are not representative, such as the first frame of a window
+                durations.append((int(items[columns[1]]) - int(items[columns[0]])) / 1000000.0)
+        return sorted(durations)
+        
+    def parse(self, data):
+        durations = self.get_durations(data)
+        if durations:
+            values = [percentile(durations, p) for p in PERCENTILES]
+            values += [len(durations), len([d for d in durations if d > JANK_MS]), len([d for d in durations if d > FROZEN_MS])]
+        else:
+            values = [None] * len(PERCENTILES) + [0, 0, 0]
+        self.store.append(data.timestamp, values)
+        
+    def get_sheets(self):
+        short_name = self.process_name.split('.')[-1]
+        percentiles = ['p%d' % p for p in PERCENTILES]
+        return [('gfxinfo.frame.%s' % short_name, 'time (m/d H:M:S)', self.y_axis, ['timestamp'] + percentiles, self.store.select(percentiles)),
+                ('gfxinfo.jank.%s' % short_name, 'time (m/d H:M:S)', 'frames', ['timestamp', 'frames', 'janky', 'frozen'], self.store.select(['frames', 'janky', 'frozen']))]
+    
+# classes charted by the growth of their shallow size across the heap dumps
+HEAP_TOP = 10
+
+class HeapPlugin(Plugin):
+    '''Class histograms of the heap dumps, see hprof.summarize, the classes are discovered while parsing like LatencyPlugin.'''
+    def __init__(self):
+        Plugin.__init__(self, 'dumpheap.total', 'heap (MB)', [], Operation(divisor=1024.0 * 1024))
+        self.counts = MetricStore([], self.store.timestamps, self.store.labels)
+        self.totals = MetricStore(['shallow', 'objects'], self.store.timestamps, self.store.labels)
+        
+    def parse(self, data):
+        sizes, counts, totals = {}, {}, [None, None]
+        for line in data.get_lines():
+            items = line.split(' ', 2)
+            if len(items) != 3 or not items[1].isdigit():
+                continue
+            if items[0] == 'TOTAL':
+                totals = [self.operation(items[1]), float(items[2])]
+                continue
+            if items[2] not in self.store.headings:
+                self.store.add_heading(items[2])
+                self.counts.add_heading(items[2])
+            sizes[items[2]] = items[0]
+            counts[items[2]] = items[1]
+        self.store.append(data.timestamp, convert_values(self.store.headings, self.operation, sizes))
+        self.counts.append_values(convert_values(self.counts.headings, float, counts))
+        self.totals.append_values(totals)
+        
+    def get_growing(self):
+        '''the HEAP_TOP classes whose shallow size grew the most from their first dump to their last'''
+        growth = {}
+        for heading, column, mask in zip(self.store.headings, self.store.columns, self.store.masks):
+            present = [value for value, flag in zip(column, mask) if flag]
+            if len(present) > 1 and present[-1] > present[0]:
+                growth[heading] = present[-1] - present[0]
+        return sorted(growth, key=lambda heading: (-growth[heading], heading))[:HEAP_TOP]
+        
+    def get_sheets(self):
+        names = self.get_growing()
+        sheets = [('dumpheap.total', 'time (m/d H:M:S)', 'heap (MB)', ['timestamp', 'shallow'], self.totals.select(['shallow'])),
+                  ('dumpheap.objects', 'time (m/d H:M:S)', 'objects', ['timestamp', 'objects'], self.totals.select(['objects']))]
+        if names:
+            sheets += [('dumpheap.growth', 'time (m/d H:M:S)', 'shallow size (MB)', ['timestamp'] + names, self.store.select(names)),
+                       ('dumpheap.growth_count', 'time (m/d H:M:S)', 'instances', ['timestamp'] + names, self.counts.select(names))]
+        return sheets
+    
+    def get_state(self):
+        return self.store, self.counts, self.totals
+    
+    def set_state(self, state):
+        self.store, self.counts, self.totals = state
+        for store in (self.counts, self.totals):
+            store.timestamps, store.labels = self.store.timestamps, self.store.labels
+    
+def parse_top_table(data):
+    table = {}
+    header = False
+    for line in data.get_lines():
+        items = line.split()
+        if not header:
+            header = 'PID' in items and 'Name' in items
+            continue
+        if len(items) < 4 or not items[0].isdigit():
+            continue
+        for i, item in enumerate(items):
+            if item.endswith('%'):
+                break
+        else:
+            continue
+        name = items[-1]
+        if name not in table:
+            table[name] = {'pid': items[0], 'cpu': items[i][:-1], 'thr': items[i + 2] if i + 2 < len(items) else None}
+    return table
+
+MEMINFO_PROCESS = re.compile(r'^\s*(?P<pss>[\d,]+)\s*(?:kB|K): (?P<name>\S+) \(pid (?P<pid>\d+)', re.MULTILINE)
+
+def parse_meminfo_table(data):
+    table = {}
+    for m in data.finditer(MEMINFO_PROCESS):
+        if m.group('name') not in table:
+            table[m.group('name')] = {'pss': m.group('pss').replace(',', ''), 'pid': m.group('pid')}
+    return table
+
+CPUINFO_PROCESS = re.compile(r'^\s*[+-]?(?P<usage>[\d.]+)% (?P<pid>\d+)/(?P<name>\S+): (?P<user>[\d.]+)% user \+ (?P<kernel>[\d.]+)% kernel', re.MULTILINE)
+
+def parse_cpuinfo_table(data):
+    table = {}
+    for m in data.finditer(CPUINFO_PROCESS):
+        rowd = m.groupdict()
+        if rowd['name'] not in table:
+            table[rowd['name']] = rowd
+    return table
+
+class ProcessPlugin(Plugin):
+    '''Index each sample by process name once, then chart any number of processes.
+
+    metrics is a list of (name prefix, y axis, headings, operation), every
+    named process gets one sheet per metric. With top set, every process
+    is kept and the top busiest by the first heading are charted together,
+    a top of 0 charts all processes.
+    '''
+    def __init__(self, parse_table, metrics, process_names, top=None):
+        Plugin.__init__(self, metrics[0][0], metrics[0][1], metrics[0][2], metrics[0][3])
+        self.parse_table = parse_table
+        self.metrics = metrics
+        self.process_names = process_names
+        self.top = top
+        self.fields = [heading for metric in metrics for heading in metric[2]]
+        # timestamps shared by the stores of all processes
+        self.index = MetricStore([])
+        self.stores = {}
+        for process_name in process_names:
+            self.stores[process_name] = self.new_store()
+            
+    def new_store(self):
+        store = MetricStore(self.fields, self.index.timestamps, self.index.labels)
+        store.append_missing(len(self.index))
+        return store
+    
+    def convert(self, rowd):
+        values = []
+        for prefix, y_axis, headings, operation in self.metrics:
+            if rowd:
+                values += convert_values(headings, operation, rowd)
+            else:
+                values += [None] * len(headings)
+        return values
+        
+    def parse(self, data):
+        table = self.parse_table(data)
+        if self.top is not None:
+            for process_name in table:
+                if process_name not in self.stores:
+                    self.stores[process_name] = self.new_store()
+        self.index.append(data.timestamp, [])
+        for process_name, store in self.stores.iteritems():
+            store.append_values(self.convert(table.get(process_name)))
+                
+    @property
+    def key(self):
+        return 'process.%s:%s:%s' % (self.name, ','.join(self.process_names), self.top)
+    
+    def get_state(self):
+        # a stateful parse_table, such as ProcStatTable, keeps its counters with the stores
+        table_state = self.parse_table.get_state() if hasattr(self.parse_table, 'get_state') else None
+        return self.index, self.stores, table_state
+    
+    def set_state(self, state):
+        self.index, self.stores, table_state = state
+        if table_state is not None:
+            self.parse_table.set_state(table_state)
+        for store in self.stores.itervalues():
+            store.timestamps, store.labels = self.index.timestamps, self.index.labels
+    
+    def get_top_names(self):
+        # missing values are stored as 0
+        totals = dict((process_name, sum(store.columns[0])) for process_name, store in self.stores.iteritems())
+        names = sorted(totals, key=lambda process_name: (-totals[process_name], process_name))
+        if self.top > 0:
+            names = names[:self.top]
+        return names
+        
+    def get_sheets(self):
+        sheets = []
+        for process_name in self.process_names:
+            short_name = process_name.split('.')[-1]
+            store = self.stores[process_name]
+            for prefix, y_axis, headings, operation in self.metrics:
+                sheets.append(('%s.%s' % (prefix, short_name), 'time (m/d H:M:S)', y_axis, ['timestamp'] + headings, store.select(headings)))
+        if self.top is not None:
+            prefix, y_axis, headings, operation = self.metrics[0]
+            names = self.get_top_names()
+            store = MetricStore([], self.index.timestamps, self.index.labels)
+            for process_name in names:
+                store.merge(process_name, self.stores[process_name], headings[0])
+            sheets.append(('%s.%s' % (prefix, 'top%d' % self.top if self.top > 0 else 'all'), 'time (m/d H:M:S)', y_axis, ['timestamp'] + names, store))
+        return sheets
+    
+class LogStatsInfo(Info):
+    def get_plugins(self):
+        return [RegexPlugin('logstats.gc', 'pause (ms)', ['gc_pause', 'gc_pause_max'],
+                            r'gc_pause=(?P<gc_pause>\S+) gc_pause_max=(?P<gc_pause_max>\S+)', keyword='gc_pause='),
+                RegexPlugin('logstats.gc_freed', 'freed (MB)', ['gc_freed'], r'gc_freed=(?P<gc_freed>\S+)',
+                            operation=Operation(divisor=1024.0), keyword='gc_freed='),
+                RegexPlugin('logstats.frames', 'frames', ['skipped_frames', 'janks'],
+                            r'skipped_frames=(?P<skipped_frames>\d+) janks=(?P<janks>\d+)', keyword='skipped_frames='),
+                RegexPlugin('logstats.events', 'events', ['gc', 'proc_died', 'crash', 'lmk_kill'],
+                            r'gc=(?P<gc>\d+) .* proc_died=(?P<proc_died>\d+) crash=(?P<crash>\d+) lmk_kill=(?P<lmk_kill>\d+)', keyword='proc_died='),
+                HistogramPlugin('logstats.gc_histogram', 'gc pause (ms)', 'pause', [1, 2, 5, 10, 20, 50, 100, 200, 500]),
+                HistogramPlugin('logstats.frames_histogram', 'skipped frames', 'skipped', [5, 10, 30, 60, 120, 300])]
+    
+class GfxInfo(Info):
+    def get_plugins_with_process_name(self, process_name):
+        return [FramePlugin(process_name)]
+    
+class DumpheapInfo(Info):
+    def get_plugins(self):
+        return [HeapPlugin()]
+    
 INFO_CONFIG = {
     'cpuinfo': CpuInfo,
     'meminfo': MemInfo,
     'top': TopInfo,
     'temperature_zone0': Temp0Info,
-    'temperature_zone1': Temp1Info
+    'temperature_zone1': Temp1Info,
+    'latency': LatencyInfo,
+    'procfs': ProcfsInfo,
+    'sysfs': SysfsInfo,
+    'logstats': LogStatsInfo,
+    'gfxinfo': GfxInfo,
+    'dumpheap': DumpheapInfo
 }
         
\ No newline at end of file
@@ -0,0 +1,73 @@
+# encoding: utf-8
+'''
+@author:     Juncheng Chen
+
+@copyright:  1999-2015 Alibaba.com. All rights reserved.
+
+@license:    Apache Software License 2.0
+
+@contact:    juncheng.cjc@outlook.com
+'''
+import re
+
+from tvb.storage import LogTail
+
+import logging
+logger = logging.getLogger(__name__)
+
+# art:    Background concurrent copying GC freed 12345(1234KB) AllocSpace objects, 3(2MB) LOS objects, 49% free, 10MB/20MB, paused 1.234ms,250us total 50.1ms
+# dalvik: GC_CONCURRENT freed 2049K, 65% free 3571K/9991K, external 4703K/5261K, paused 2ms+2ms
+ART_FREED = re.compile(r'\((\d+)(B|KB|MB|GB)\) (?:AllocSpace|LOS) objects')
+DALVIK_FREED = re.compile(r'GC_\w+ freed (?:<)?(\d+)K')
+GC_PAUSED = re.compile(r'paused ([\d.]+(?:us|ms|s)(?:[,+][\d.]+(?:us|ms|s))*)')
+PAUSE = re.compile(r'([\d.]+)(us|ms|s)')
+SKIPPED_FRAMES = re.compile(r'Skipped (\d+) frames!')
+UNITS = {'B': 1.0 / 1024, 'KB': 1, 'MB': 1024, 'GB': 1024 * 1024}
+SCALES = {'us': 0.001, 'ms': 1, 's': 1000}
+
+def parse_pause(text):
+    '''total milliseconds of "1.2ms,250us" or "2ms+2ms"'''
+    return sum(float(value) * SCALES[unit] for value, unit in PAUSE.findall(text))
+
+class LogStats(object):
+    '''Performance events found in the logcat logs since the previous sample.
+
+    The logcat and event logs are tailed, so every line is read once
+    however long the collection runs. A sample is a summary line and
+    one line per GC pause and per skipped frames report, for the
+    histograms of LogStatsInfo.
+    '''
+    def __init__(self, log_dir):
+        self.tail = LogTail(log_dir, 'logcat_')
+
+    def collect(self):
+        gc_count, gc_pause, gc_pause_max, gc_freed = 0, 0.0, 0.0, 0.0
+        skipped, janks, died, crashes, kills = 0, 0, 0, 0, 0
+        details = []
+        for line in self.tail.read():
+            if ' GC ' in line or 'GC_' in line:
+                m = GC_PAUSED.search(line)
+                if m is None:
+                    continue
+                pause = parse_pause(m.group(1))
+                gc_count += 1
+                gc_pause += pause
+                gc_pause_max = max(gc_pause_max, pause)
+                gc_freed += sum(int(value) * UNITS[unit] for value, unit in ART_FREED.findall(line))
+                gc_freed += sum(int(value) for value in DALVIK_FREED.findall(line))
+                details.append('pause %.3f' % pause)
+            elif 'Skipped ' in line:
+                m = SKIPPED_FRAMES.search(line)
+                if m:
+                    skipped += int(m.group(1))
+                    janks += 1
+                    details.append('skipped %s' % m.group(1))
+            elif 'am_proc_died' in line:
+                died += 1
+            elif 'am_crash' in line:
+                crashes += 1
+            elif ('lowmemorykiller' in line and 'Kill' in line) or ' killinfo' in line:
+                kills += 1
+        summary = 'gc=%d gc_pause=%.3f gc_pause_max=%.3f gc_freed=%.1f skipped_frames=%d janks=%d proc_died=%d crash=%d lmk_kill=%d' % \
+                  (gc_count, gc_pause, gc_pause_max, gc_freed, skipped, janks, died, crashes, kills)
+        return '\n'.join([summary] + details)
@@ -0,0 +1,62 @@
+# encoding: utf-8
+'''
+@author:     Juncheng Chen
+
+@copyright:  1999-2015 Alibaba.com. All rights reserved.
+
+@license:    Apache Software License 2.0
+
+@contact:    juncheng.cjc@outlook.com
+'''
+import os
+import json
+from threading import Lock
+
+import logging
+logger = logging.getLogger(__name__)
+
+METADATA_PATH = os.path.join(os.path.expanduser('~'), '.tvb', 'devices.json')
+
+class DeviceMetadata(object):
+    '''Static facts of every device seen so far, keyed by serial or ip address and kept across runs.
+
+    Core number, model, Android version and RAM size do not change
+    between two runs, so only new devices, or all of them on refresh,
+    are probed. Device checks the serial of a record before using it.
+    '''
+    def __init__(self, path=METADATA_PATH, refresh=False):
+        self.path = path
+        self.refresh = refresh
+        self.lock = Lock()
+        self.devices = {}
+        self.changed = False
+        try:
+            with open(path, 'r') as f:
+                self.devices = json.load(f)
+        except (IOError, ValueError):
+            pass
+
+    def get(self, device):
+        if self.refresh:
+            return None
+        with self.lock:
+            return self.devices.get(device)
+
+    def set(self, device, metadata):
+        with self.lock:
+            self.devices[device] = metadata
+            self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        temp_path = '%s.tmp' % self.path
+        try:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            with open(temp_path, 'w') as f:
+                json.dump(self.devices, f, indent=2, sort_keys=True)
+            os.rename(temp_path, self.path)
+            self.changed = False
+        except (IOError, OSError), e:
+            logger.error('save device metadata %s failed: %s' % (self.path, e))
@@ -10,6 +10,7 @@
 '''
 import os
 from datetime import datetime
+from multiprocessing import Pool
 
 from excel import Excel
 from info import INFO_CONFIG
@@ -17,12 +18,43 @@ from info import INFO_CONFIG
 import logging
 logger = logging.getLogger(__name__)
 
+def parse_file(task):
+    device_dir, file_names, process_names, core_num, top, cache, export = task
+    name = file_names[0].split('.')[0]
+    info = INFO_CONFIG.get(name)(device_dir, file_names, process_names, core_num, top, cache)
+    sheets = list(info.get_sheet_list())
+    if export:
+        export_metrics(device_dir, sheets)
+    return sheets
+
+def export_metrics(device_dir, sheets):
+    '''write the store of every sheet to <device>/metrics/<sheet>.tvbm, see MetricStore.load'''
+    metrics_dir = os.path.join(device_dir, 'metrics')
+    if not os.path.isdir(metrics_dir):
+        os.makedirs(metrics_dir)
+    for sheet in sheets:
+        with open(os.path.join(metrics_dir, '%s.tvbm' % sheet[0]), 'wb') as f:
+            sheet[4].dump(f)
+
+def save_book(task):
+    '''parse the logs of one device and write their sheets to its workbook, one log at a time'''
+    book_name, tasks, chart_points = task
+    excel = Excel(book_name, chart_points)
+    for file_task in tasks:
+        for sheet in parse_file(file_task):
+            logger.info('add sheet %s' % sheet[0])
+            excel.add_sheet(*sheet)
+    logger.info('wait to save %s' % book_name)
+    excel.save()
+    return book_name
+
 class Report(object):
-    def __init__(self, log_dir, process_names=[]):
+    def __init__(self, log_dir, process_names=[], top=None, jobs=1, cache=True, export=False, chart_points=0):
         os.chdir(log_dir)
         if process_names is None:
             process_names = []
         self.process_names = process_names
+        books = []
         for device_dir in self.list_device_dirs():
             logger.info('create report for %s' % device_dir)
             core_num = 1
@@ -35,15 +67,19 @@ class Report(object):
             logger.debug('%s' % file_names)
             if file_names:
                 book_name = '%s-%s.xlsx' % (device_dir, datetime.now().strftime('%Y.%m.%d-%H.%M.%S'))
-                excel = Excel(book_name)
-                for file_name in file_names:
-                    name = file_name.split('.')[0]
-                    info = INFO_CONFIG.get(name)(device_dir, file_name, process_names, core_num)
-                    for sheet in info.get_sheet_list():
-                        logger.info('add sheet %s' % sheet[0])
-                        excel.add_sheet(*sheet)
-                logger.info('wait to save %s' % book_name)
-                excel.save()
+                books.append((book_name, [(device_dir, segments, process_names, core_num, top, cache, export) for segments in self.group_segments(file_names)], chart_points))
+        if jobs > 1 and len(books) > 1:
+            # every workbook is parsed and saved by one worker, only its name comes back
+            pool = Pool(jobs)
+            try:
+                for book_name in pool.imap_unordered(save_book, books):
+                    logger.info('saved %s' % book_name)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for book in books:
+                save_book(book)
         
     def list_device_dirs(self):
         return [d for d in os.listdir('.') if os.path.isdir(d)]
@@ -51,3 +87,10 @@ class Report(object):
     def filter_file_names(self, device):
         return [f for f in os.listdir(device) if os.path.isfile(os.path.join(device, f)) and f.split('.')[0] in INFO_CONFIG.keys()]
     
+    def group_segments(self, file_names):
+        '''files of every log, the rotated segments top.<timestamp>.txt by age and the active top.txt last'''
+        groups = {}
+        for file_name in file_names:
+            groups.setdefault(file_name.split('.')[0], []).append(file_name)
+        return [sorted(segments, key=lambda f: (f.split('.')[1] == 'txt', f)) for name, segments in sorted(groups.iteritems())]
+    
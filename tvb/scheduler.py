@@ -0,0 +1,60 @@
+# encoding: utf-8
+'''
+@author:     Juncheng Chen
+
+@copyright:  1999-2015 Alibaba.com. All rights reserved.
+
+@license:    Apache Software License 2.0
+
+@contact:    juncheng.cjc@outlook.com
+'''
+import heapq
+import random
+from itertools import count
+from time import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+class Scheduler(object):
+    '''Heap of commands keyed on their next due time.
+
+    Every command keeps a drift free base schedule advanced by its own
+    period, jitter only delays the actual run after the base time.
+    '''
+    def __init__(self, commands, start=None):
+        self.heap = []
+        self.counter = count()
+        if start is None:
+            start = time()
+        for command in commands:
+            self.push(command, start + command.get_first_delay())
+
+    def push(self, command, base):
+        due = base
+        if command.jitter:
+            due += random.uniform(0, command.jitter)
+        heapq.heappush(self.heap, (due, next(self.counter), base, command))
+
+    def next_due(self):
+        if self.heap:
+            return self.heap[0][0]
+
+    def pop_due(self, now):
+        '''return [(base, command)] of every command due at now'''
+        entries = []
+        while self.heap and self.heap[0][0] <= now:
+            due, unused, base, command = heapq.heappop(self.heap)
+            entries.append((base, command))
+        return entries
+
+    def reschedule(self, base, command, now):
+        '''queue the next run of command, return how many seconds it fell behind'''
+        base += command.get_delay()
+        late = 0
+        if base < now:
+            # skip the runs we missed instead of bursting to catch up
+            late = now - base
+            base = now
+        self.push(command, base)
+        return late
@@ -0,0 +1,95 @@
+# encoding: utf-8
+'''
+@author:     Juncheng Chen
+
+@copyright:  1999-2015 Alibaba.com. All rights reserved.
+
+@license:    Apache Software License 2.0
+
+@contact:    juncheng.cjc@outlook.com
+'''
+import os
+import csv
+import json
+from collections import OrderedDict
+from datetime import datetime
+from Queue import Queue
+from threading import Thread
+
+from tvb.info import INFO_CONFIG, Data
+
+import logging
+logger = logging.getLogger(__name__)
+
+SINK_FORMATS = ['csv', 'jsonl']
+TIME_AXIS = 'time (m/d H:M:S)'
+
+class MetricSink(object):
+    '''Parse the samples of one log on a thread of its own and append the new rows to <device>/metrics/<sheet>.<format>.'''
+    def __init__(self, device_dir, name, format, process_names=[], core_num=1, top=None):
+        self.metrics_dir = os.path.join(device_dir, 'metrics')
+        if not os.path.isdir(self.metrics_dir):
+            os.makedirs(self.metrics_dir)
+        self.format = format
+        self.info = INFO_CONFIG.get(name)(device_dir, None, process_names or [], core_num, top)
+        # rows and columns already written for every sheet
+        self.written = {}
+        self.headings = {}
+        self.queue = Queue()
+        self.thread = Thread(target=self.run, name='%s sink' % name)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def handle(self, timestamp, output):
+        self.queue.put((timestamp, output))
+
+    def run(self):
+        for timestamp, output in iter(self.queue.get, None):
+            try:
+                self.info.parser.parse(Data(timestamp, output))
+                for sheet in self.info.get_sheet_list():
+                    self.write(sheet[0], sheet[3], sheet[4], sheet[1] != TIME_AXIS)
+            except Exception, e:
+                logger.error('sink %s failed: %s' % (self.info.__class__.__name__, e))
+
+    def close(self):
+        '''write the queued samples and stop the thread'''
+        self.queue.put(None)
+        self.thread.join()
+
+    def get_segment_path(self, sheet_name):
+        '''name for the rows written under an older header, top.cpu.csv becomes top.cpu.<timestamp>.csv'''
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        segment = os.path.join(self.metrics_dir, '%s.%s.%s' % (sheet_name, timestamp, self.format))
+        count = 0
+        while os.path.exists(segment):
+            count += 1
+            segment = os.path.join(self.metrics_dir, '%s.%s_%03d.%s' % (sheet_name, timestamp, count, self.format))
+        return segment
+
+    def write(self, sheet_name, headings, store, rewrite=False):
+        '''append the new rows of store, or rewrite all of them for a sheet not indexed by time such as a histogram'''
+        path = os.path.join(self.metrics_dir, '%s.%s' % (sheet_name, self.format))
+        start = 0 if rewrite else self.written.get(sheet_name, 0)
+        if self.format == 'jsonl':
+            with open(path, 'a' if start else 'w') as f:
+                for index in xrange(start, len(store)):
+                    f.write('%s\n' % json.dumps(OrderedDict((heading, value) for heading, value in zip(headings, store.get_row(index)) if value != '')))
+        else:
+            columns = self.headings.get(sheet_name)
+            header = columns is None or rewrite
+            if not header and [heading for heading in headings if heading not in columns]:
+                # a new column, such as a process entering the top, starts a new file, the rows written so far keep their header
+                os.rename(path, self.get_segment_path(sheet_name))
+                header = True
+            if header:
+                columns = (columns or []) + [heading for heading in headings if heading not in (columns or [])]
+                self.headings[sheet_name] = columns
+            with open(path, 'wb' if header else 'ab') as f:
+                writer = csv.writer(f)
+                if header:
+                    writer.writerow([heading.encode('utf-8') if isinstance(heading, unicode) else heading for heading in columns])
+                for index in xrange(start, len(store)):
+                    rowd = dict(zip(headings, store.get_row(index)))
+                    writer.writerow([rowd.get(heading, '') for heading in columns])
+        self.written[sheet_name] = len(store)
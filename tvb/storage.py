@@ -0,0 +1,260 @@
+# encoding: utf-8
+'''
+@author:     Juncheng Chen
+
+@copyright:  1999-2015 Alibaba.com. All rights reserved.
+
+@license:    Apache Software License 2.0
+
+@contact:    juncheng.cjc@outlook.com
+'''
+import os
+import re
+import gzip
+import zlib
+from datetime import datetime
+from threading import Thread, Lock
+from time import time
+
+from tvb.cache import ParseCache
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+COMPRESSORS = sorted(EXTENSIONS.keys())
+READ_SIZE = 1024 * 1024
+# seconds between two flush points of a streamed log
+FLUSH_INTERVAL = 1
+
+def check_compress(compress):
+    if compress == 'zstd' and zstandard is None:
+        raise Exception('zstd compression needs the zstandard package')
+
+def is_compressed(path):
+    return any(path.endswith(extension) for extension in EXTENSIONS.values())
+
+class Rotation(object):
+    '''When a log starts a new segment, and how many rotated segments of a device are kept.
+
+    Sizes are in bytes and times in seconds, None disables a limit.
+    '''
+    def __init__(self, size=None, seconds=None, retention_size=None, retention_seconds=None):
+        self.size = size
+        self.seconds = seconds
+        self.retention_size = retention_size
+        self.retention_seconds = retention_seconds
+        self.lock = Lock()
+
+    def is_due(self, size, opened):
+        return (self.size is not None and size >= self.size) or (self.seconds is not None and time() - opened >= self.seconds)
+
+    def apply_retention(self, log_dir):
+        '''delete the oldest rotated segments in log_dir beyond the retention limits'''
+        if self.retention_size is None and self.retention_seconds is None:
+            return
+        with self.lock:
+            total, segments = 0, []
+            for name in os.listdir(log_dir):
+                path = os.path.join(log_dir, name)
+                if not os.path.isfile(path):
+                    continue
+                st = os.stat(path)
+                total += st.st_size
+                if is_segment(name):
+                    segments.append((st.st_mtime, st.st_size, path))
+            now = time()
+            for mtime, size, path in sorted(segments):
+                if (self.retention_size is None or total <= self.retention_size) and \
+                        (self.retention_seconds is None or now - mtime <= self.retention_seconds):
+                    break
+                logger.info('retention delete %s' % path)
+                for remove in (path, ParseCache(path).cache_path):
+                    try:
+                        os.remove(remove)
+                    except OSError:
+                        pass
+                total -= size
+
+SEGMENT = re.compile(r'^[^.]+\.\d{8}_\d{6}(_\d+)?\.txt')
+
+def is_segment(file_name):
+    return SEGMENT.match(file_name) is not None
+
+def get_segment_path(path):
+    '''name for the segment rotated out of path, top.txt.gz becomes top.<timestamp>.txt.gz'''
+    log_dir, name = os.path.split(path)
+    stem, extension = name.split('.', 1)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    segment = os.path.join(log_dir, '%s.%s.%s' % (stem, timestamp, extension))
+    count = 0
+    while os.path.exists(segment):
+        count += 1
+        segment = os.path.join(log_dir, '%s.%s_%03d.%s' % (stem, timestamp, count, extension))
+    return segment
+
+class LogWriter(object):
+    '''Append to path, through a streaming compressor when compress is set.
+
+    Every flush is a sync point, what was written before it can be read
+    back even if the writer is never closed. With a rotation the file is
+    renamed to a segment between two writes, so no write is ever split.
+    '''
+    def __init__(self, path, compress=None, rotation=None):
+        self.compress = compress
+        if compress:
+            check_compress(compress)
+            path += EXTENSIONS[compress]
+        self.path = path
+        self.rotation = rotation
+        self.open()
+
+    def open(self):
+        self.raw = open(self.path, 'ab')
+        self.opened = time()
+        self.size = os.fstat(self.raw.fileno()).st_size
+        if self.compress == 'gzip':
+            # every writer appends a new gzip member, readers join them
+            self.file = gzip.GzipFile(fileobj=self.raw, mode='ab')
+        elif self.compress == 'zstd':
+            self.file = zstandard.ZstdCompressor().stream_writer(self.raw)
+        else:
+            self.file = self.raw
+
+    def write(self, data, flush=True):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        if self.rotation and self.size and self.rotation.is_due(self.size, self.opened):
+            self.rotate()
+        self.file.write(data)
+        if flush:
+            self.flush()
+
+    def flush(self):
+        if self.compress == 'zstd':
+            self.file.flush(zstandard.FLUSH_BLOCK)
+        else:
+            self.file.flush()
+        self.raw.flush()
+        self.size = os.fstat(self.raw.fileno()).st_size
+
+    def rotate(self):
+        self.close()
+        segment = get_segment_path(self.path)
+        logger.debug('rotate %s to %s' % (self.path, segment))
+        os.rename(self.path, segment)
+        self.open()
+        self.rotation.apply_retention(os.path.dirname(self.path))
+
+    def close(self):
+        if self.compress == 'zstd':
+            self.file.flush(zstandard.FLUSH_FRAME)
+        elif self.compress == 'gzip':
+            self.file.close()
+        self.raw.close()
+
+class LogPump(Thread):
+    '''Copy the stdout of a durable command into a LogWriter, flushing at most every FLUSH_INTERVAL seconds.'''
+    def __init__(self, stream, writer):
+        Thread.__init__(self, name='pump %s' % writer.path)
+        self.setDaemon(True)
+        self.stream = stream
+        self.writer = writer
+
+    def run(self):
+        last_flush = time()
+        try:
+            for line in iter(self.stream.readline, ''):
+                self.writer.write(line, flush=False)
+                if time() - last_flush >= FLUSH_INTERVAL:
+                    self.writer.flush()
+                    last_flush = time()
+        except Exception, e:
+            logger.error('pump %s failed: %s' % (self.writer.path, e))
+        finally:
+            self.writer.close()
+
+def new_decompressor(path):
+    if path.endswith(EXTENSIONS['gzip']):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    check_compress('zstd')
+    return zstandard.ZstdDecompressor().decompressobj()
+
+def inflate(path, decompressor, raw):
+    '''return (data, decompressor), a new decompressor goes on after the end of a gzip member or zstd frame'''
+    chunks = []
+    while raw:
+        chunks.append(decompressor.decompress(raw))
+        # the rest of the data after the end of a gzip member or zstd frame starts the next one
+        raw = getattr(decompressor, 'unused_data', '')
+        if raw:
+            decompressor = new_decompressor(path)
+    return ''.join(chunks), decompressor
+
+def read_chunks(path):
+    '''yield the decompressed content of a log, a tail cut off by a crash is dropped'''
+    with open(path, 'rb') as f:
+        if not is_compressed(path):
+            for chunk in iter(lambda: f.read(READ_SIZE), ''):
+                yield chunk
+            return
+        decompressor = new_decompressor(path)
+        for raw in iter(lambda: f.read(READ_SIZE), ''):
+            try:
+                chunk, decompressor = inflate(path, decompressor, raw)
+            except Exception, e:
+                logger.error('%s is corrupt: %s' % (path, e))
+                return
+            if chunk:
+                yield chunk
+
+class LogTail(object):
+    '''Follow the logs of a directory whose names start with prefix, every read returns the lines appended since the previous one.
+
+    Logs are followed by inode, so the rest of a log rotated to a segment
+    is still read, and compressed logs are decompressed incrementally.
+    '''
+    def __init__(self, log_dir, prefix):
+        self.log_dir = log_dir
+        self.prefix = prefix
+        # inode: [offset, decompressor, incomplete last line]
+        self.files = {}
+        
+    def read(self):
+        lines = []
+        inodes = set()
+        for name in sorted(os.listdir(self.log_dir)):
+            if not name.startswith(self.prefix) or '.txt' not in name:
+                continue
+            path = os.path.join(self.log_dir, name)
+            try:
+                st = os.stat(path)
+                size = st.st_size
+                inodes.add(st.st_ino)
+                state = self.files.get(st.st_ino)
+                if state is None or size < state[0]:
+                    # a new log, or a deleted one whose inode was reused
+                    state = self.files[st.st_ino] = [0, new_decompressor(path) if is_compressed(path) else None, '']
+                if size == state[0]:
+                    continue
+                with open(path, 'rb') as f:
+                    f.seek(state[0])
+                    for raw in iter(lambda: f.read(min(READ_SIZE, size - state[0])), ''):
+                        state[0] += len(raw)
+                        data = raw
+                        if state[1] is not None:
+                            data, state[1] = inflate(path, state[1], raw)
+                        data = (state[2] + data).split('\n')
+                        state[2] = data.pop()
+                        lines.extend(data)
+            except Exception, e:
+                logger.error('tail %s failed: %s' % (path, e))
+        # forget the logs deleted by the rotation, their decompressors hold memory
+        for inode in [inode for inode in self.files if inode not in inodes]:
+            del self.files[inode]
+        return lines
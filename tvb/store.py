@@ -0,0 +1,171 @@
+# encoding: utf-8
+'''
+@author:     Juncheng Chen
+
+@copyright:  1999-2015 Alibaba.com. All rights reserved.
+
+@license:    Apache Software License 2.0
+
+@contact:    juncheng.cjc@outlook.com
+'''
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta
+from cStringIO import StringIO
+
+import logging
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = '%m/%d %H:%M:%S'
+# timestamps carry no year, a leap year keeps 02/29 valid
+EPOCH = datetime(2000, 1, 1)
+MAGIC = 'TVBM'
+VERSION = 1
+
+def parse_timestamp(timestamp):
+    '''seconds since 01/01 00:00:00, -1 when timestamp is not in TIMESTAMP_FORMAT'''
+    try:
+        # parsed with the year of EPOCH, strptime alone defaults to 1900 which has no 02/29
+        delta = datetime.strptime('%d/%s' % (EPOCH.year, timestamp), '%Y/' + TIMESTAMP_FORMAT) - EPOCH
+    except ValueError:
+        return -1
+    return delta.days * 86400 + delta.seconds
+
+def format_timestamp(seconds):
+    return (EPOCH + timedelta(seconds=seconds)).strftime(TIMESTAMP_FORMAT)
+
+class MetricStore(object):
+    '''Columnar metrics: integer timestamps, one float array and one presence mask per heading.
+
+    Stores created with the timestamps and labels of another store share
+    them and only append values, ProcessPlugin keeps one per process.
+    Iterating yields [timestamp, value or '', ...] rows like Plugin.rows used to.
+    '''
+    def __init__(self, headings, timestamps=None, labels=None):
+        self.headings = list(headings)
+        self.timestamps = array('i') if timestamps is None else timestamps
+        # timestamps that could not be parsed, by row index
+        self.labels = {} if labels is None else labels
+        self.columns = [array('d') for unused in self.headings]
+        self.masks = [array('B') for unused in self.headings]
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, timestamp, values):
+        seconds = parse_timestamp(timestamp)
+        if seconds < 0:
+            self.labels[len(self.timestamps)] = timestamp
+        self.timestamps.append(seconds)
+        self.append_values(values)
+
+    def append_values(self, values):
+        '''values are numbers or None for missing ones'''
+        for column, mask, value in zip(self.columns, self.masks, values):
+            if value is None:
+                column.append(0.0)
+                mask.append(0)
+            else:
+                column.append(value)
+                mask.append(1)
+
+    def append_missing(self, count=1):
+        for column, mask in zip(self.columns, self.masks):
+            column.extend([0.0] * count)
+            mask.extend([0] * count)
+
+    def add_heading(self, heading):
+        self.headings.append(heading)
+        self.columns.append(array('d', [0.0] * len(self.timestamps)))
+        self.masks.append(array('B', [0] * len(self.timestamps)))
+
+    def get_timestamp(self, index):
+        if index in self.labels:
+            return self.labels[index]
+        return format_timestamp(self.timestamps[index])
+
+    def get_value(self, column, index):
+        if self.masks[column][index]:
+            return self.columns[column][index]
+        return ''
+
+    def get_row(self, index):
+        return [self.get_timestamp(index)] + [self.get_value(column, index) for column in range(len(self.columns))]
+
+    def __iter__(self):
+        for index in xrange(len(self.timestamps)):
+            yield self.get_row(index)
+
+    def select(self, headings):
+        '''store sharing timestamps and columns of the given headings'''
+        store = MetricStore([], self.timestamps, self.labels)
+        for heading in headings:
+            column = self.headings.index(heading)
+            store.headings.append(heading)
+            store.columns.append(self.columns[column])
+            store.masks.append(self.masks[column])
+        return store
+
+    def merge(self, heading, store, column_heading):
+        '''add column_heading of store, which shares our timestamps, as heading'''
+        column = store.headings.index(column_heading)
+        self.headings.append(heading)
+        self.columns.append(store.columns[column])
+        self.masks.append(store.masks[column])
+
+    def dump(self, f):
+        header = struct.pack('<4sBBII', MAGIC, VERSION, sys.byteorder == 'little', len(self.headings), len(self.timestamps))
+        f.write(header)
+        for heading in self.headings:
+            write_string(f, heading)
+        f.write(struct.pack('<I', len(self.labels)))
+        for index, label in sorted(self.labels.iteritems()):
+            f.write(struct.pack('<I', index))
+            write_string(f, label)
+        f.write(self.timestamps.tostring())
+        for column, mask in zip(self.columns, self.masks):
+            f.write(column.tostring())
+            f.write(mask.tostring())
+
+    @classmethod
+    def load(cls, f):
+        magic, version, little, heading_count, count = struct.unpack('<4sBBII', f.read(struct.calcsize('<4sBBII')))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a metric store')
+        store = cls([read_string(f) for unused in range(heading_count)])
+        for unused in range(struct.unpack('<I', f.read(4))[0]):
+            index = struct.unpack('<I', f.read(4))[0]
+            store.labels[index] = read_string(f)
+        swap = bool(little) != (sys.byteorder == 'little')
+        store.timestamps.fromstring(f.read(count * store.timestamps.itemsize))
+        for column, mask in zip(store.columns, store.masks):
+            column.fromstring(f.read(count * column.itemsize))
+            mask.fromstring(f.read(count))
+            if swap:
+                column.byteswap()
+        if swap:
+            store.timestamps.byteswap()
+        return store
+
+    def __getstate__(self):
+        f = StringIO()
+        self.dump(f)
+        return f.getvalue()
+
+    def __setstate__(self, state):
+        self.__dict__.update(MetricStore.load(StringIO(state)).__dict__)
+
+def write_string(f, value):
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    f.write(struct.pack('<I', len(value)))
+    f.write(value)
+
+def read_string(f):
+    value = f.read(struct.unpack('<I', f.read(4))[0])
+    try:
+        value.decode('ascii')
+    except UnicodeDecodeError:
+        return value.decode('utf-8')
+    return value